@@ -1,24 +1,33 @@
 # mock_api/main.py
 import os
+import asyncio
+import hashlib
+import heapq
 import logging
+import mmap
+import threading
+import time
 import uuid
-import json, subprocess, sys
+import sys
+from functools import lru_cache
 from pathlib import Path
-from uuid import uuid4
+from collections import OrderedDict, deque
 from datetime import datetime, timezone
-from typing import Optional
+from typing import TYPE_CHECKING, Optional
 
+import orjson
+from anyio import to_thread
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from starlette.requests import Request
-from fastapi.responses import JSONResponse
+from fastapi.responses import ORJSONResponse, Response, StreamingResponse
 
 # ----- Models (keep your existing models.py) -----
 # Chat schemas (added earlier)
 from .models import ChatRequest, ChatResponse, ChatMessage
 # Existing simulation/job schemas (unchanged)
 from .models import SubmitRequest, SubmitResponse, StatusResponse
-from .store import InMemoryStore, Job, STORE
+from .store import InMemoryStore, JobView, STORE
 
 from fastapi.staticfiles import StaticFiles
 
@@ -37,16 +46,12 @@ TRANS_SIM_DIR = ROOT_DIR / "transport_sim"
 CONFIG_ROOT = DATA_ROOT / "configs"
 CITIES_PATH = TRANS_SIM_DIR / "data" / "cities.json"
 
-# ----- OpenAI (new 1.x client) -----
-from openai import OpenAI
-
-# ----- LlamaIndex (RAG) -----
-# If these imports fail we’ll degrade gracefully.
-try:
-    from llama_index.core import VectorStoreIndex, SimpleDirectoryReader
-except Exception as _e:  # avoid import error during dev env setup
-    VectorStoreIndex = None  # type: ignore
-    SimpleDirectoryReader = None  # type: ignore
+# ----- OpenAI (new 1.x client) / LlamaIndex (RAG) -----
+# Both are heavy; they are imported on first use (see _init_openai / _load_index_once)
+# so workers can serve health/cities/submit without paying for them.
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI
+    from llama_index.core import VectorStoreIndex
 
 # -----------------------------------------------------------------------------
 # App setup
@@ -54,7 +59,7 @@ except Exception as _e:  # avoid import error during dev env setup
 log = logging.getLogger("cityflow.api")
 logging.basicConfig(level=logging.INFO)
 
-app = FastAPI(title="CityFlow API", version="0.3.0")
+app = FastAPI(title="CityFlow API", version="0.3.0", default_response_class=ORJSONResponse)
 
 app.mount("/files", StaticFiles(directory=str(DATA_ROOT)), name="files")
 
@@ -67,36 +72,101 @@ app.add_middleware(
 
 FILES_PREFIX = "/files"  # already mounted to DATA_ROOT
 
+# JSON helpers (orjson: bytes in/out, much faster than stdlib json)
+def _loads(data):
+    return orjson.loads(data)
+
+def _dumps(obj, indent: bool = False) -> bytes:
+    # Indented output is meant for files, so it also gets a trailing newline
+    option = orjson.OPT_SERIALIZE_NUMPY
+    if indent:
+        option |= orjson.OPT_INDENT_2 | orjson.OPT_APPEND_NEWLINE
+    return orjson.dumps(obj, option=option)
+
 # Load site-level config (preferred over env for CI/CD)
 SITE_CONFIG_PATH = ROOT_DIR / "config" / "site.json"
-def _load_site_max_wait() -> int:
+
+def _mtime_ns(path: Path) -> Optional[int]:
     try:
-        with open(SITE_CONFIG_PATH, "r", encoding="utf-8") as f:
-            cfg = json.load(f)
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+@lru_cache(maxsize=1)
+def _load_site_max_wait(mtime_ns: Optional[int] = None) -> int:
+    # mtime_ns is only the cache key; a new mtime forces a re-read
+    try:
+        with open(SITE_CONFIG_PATH, "rb") as f:
+            cfg = _loads(f.read())
             v = int(cfg.get("maxStatusWaitSec", 180))
             return v
     except Exception:
         return 180
 
-MAX_STATUS_WAIT_SEC = _load_site_max_wait()
+def _max_status_wait() -> int:
+    return _load_site_max_wait(_mtime_ns(SITE_CONFIG_PATH))
+
+# Per-job memos below are small LRUs: job ids never repeat, so a plain dict would grow
+# for the life of the server. Sync endpoints run in a threadpool, hence the lock.
+_LRU_LOCK = threading.Lock()
+
+def _lru_get(cache: OrderedDict, key):
+    with _LRU_LOCK:
+        value = cache.get(key)
+        if value is not None:
+            cache.move_to_end(key)
+        return value
+
+def _lru_put(cache: OrderedDict, key, value, max_size: int) -> None:
+    with _LRU_LOCK:
+        cache[key] = value
+        cache.move_to_end(key)
+        while len(cache) > max_size:
+            cache.popitem(last=False)
+
+# job_id -> (dir mtime_ns, artifacts); a directory's mtime moves when files are added/removed
+_ARTIFACTS_CACHE: "OrderedDict[str, tuple[int, list[dict]]]" = OrderedDict()
+_ARTIFACTS_CACHE_MAX = 256
 
 def _list_artifacts(job_id: str) -> list[dict]:
     job_dir = JOBS_ROOT / job_id
-    if not job_dir.exists():
+    mtime = _mtime_ns(job_dir)
+    if mtime is None:
         return []
-    out = []
-    for p in sorted(job_dir.iterdir()):
-        if p.is_file():
-            out.append({
-                "name": p.name,
-                "url": f"{FILES_PREFIX}/jobs/{job_id}/{p.name}",
-            })
+    cached = _lru_get(_ARTIFACTS_CACHE, job_id)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    base_url = f"{FILES_PREFIX}/jobs/{job_id}/"
+    with os.scandir(job_dir) as it:
+        names = sorted(e.name for e in it if e.is_file())
+    out = [{"name": name, "url": base_url + name} for name in names]
+    _lru_put(_ARTIFACTS_CACHE, job_id, (mtime, out), _ARTIFACTS_CACHE_MAX)
     return out
 
+# cities.json rarely changes: keep the raw bytes + ETag in memory, refreshed on mtime change
+_CITIES_CACHE = {"mtime": None, "bytes": b"", "etag": ""}
+_CITIES_LOCK = threading.Lock()
+
+def _cities_payload() -> tuple[bytes, str]:
+    mtime = _mtime_ns(CITIES_PATH)
+    if mtime is not None and mtime == _CITIES_CACHE["mtime"]:
+        return _CITIES_CACHE["bytes"], _CITIES_CACHE["etag"]
+    with _CITIES_LOCK:
+        # Another thread may have refreshed while we waited
+        if mtime is None or mtime != _CITIES_CACHE["mtime"]:
+            data = CITIES_PATH.read_bytes()
+            _CITIES_CACHE["bytes"] = data
+            _CITIES_CACHE["etag"] = '"' + hashlib.blake2b(data, digest_size=16).hexdigest() + '"'
+            _CITIES_CACHE["mtime"] = mtime
+        return _CITIES_CACHE["bytes"], _CITIES_CACHE["etag"]
+
 @app.get("/v1/cities")
-def get_cities():
-    with open(CITIES_PATH, "r", encoding="utf-8") as f:
-        return JSONResponse(json.load(f))
+def get_cities(request: Request):
+    data, etag = _cities_payload()
+    headers = {"ETag": etag}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(content=data, media_type="application/json", headers=headers)
 
 # -----------------------------------------------------------------------------
 # Insights helpers
@@ -105,18 +175,84 @@ def get_cities():
 def _job_dir(job_id: str) -> Path:
     return JOBS_ROOT / job_id
 
-def _read_json_silent(path: Path):
+@lru_cache(maxsize=512)
+def _read_json_cached(path_str: str, mtime_ns: int, size: int):
+    # (mtime_ns, size) are part of the key: a rewritten file gets a fresh entry
     try:
-        with open(path, "r", encoding="utf-8") as f:
-            return json.load(f)
+        with open(path_str, "rb") as f:
+            if size == 0:
+                # mmap cannot map an empty file; let the parser reject it
+                return _loads(f.read())
+            # Parse straight from the page cache, no userland copy
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                view = memoryview(mm)
+                try:
+                    return _loads(view)
+                finally:
+                    view.release()
     except Exception:
         return None
 
-def _read_tail(path: Path, n: int = 50) -> str:
+def _read_json_silent(path: Path):
+    """Parsed JSON at `path` or None. Results are shared; treat them as read-only."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return _read_json_cached(str(path), st.st_mtime_ns, st.st_size)
+
+# job_id -> config.json bytes as written by submit_job (saves re-reading it for prompts);
+# LRU-bounded, older jobs fall back to reading the file
+_CONFIG_JSON: "OrderedDict[str, bytes]" = OrderedDict()
+_CONFIG_JSON_MAX = 256
+
+
+def _raw_json_text(path: Path, parsed) -> str:
+    """
+    The file's JSON text verbatim, else `parsed` serialized. `parsed` is what
+    _insights_ctx already read from this file, so only a cheap shape check runs here.
+    """
+    if parsed:
+        try:
+            data = path.read_bytes()
+            if data.lstrip()[:1] in (b"{", b"["):
+                return data.decode("utf-8")
+        except Exception:
+            pass
+    return _dumps(parsed or {}, indent=True).decode()
+
+def _read_text_silent(path: Path) -> str:
     try:
-        with open(path, "r", encoding="utf-8", errors="ignore") as f:
-            lines = f.readlines()[-n:]
-        return "".join(lines).strip()
+        return path.read_text(encoding="utf-8")
+    except Exception:
+        return ""
+
+def _write_text_silent(path: Path, text: str) -> None:
+    try:
+        path.write_text(text, encoding="utf-8")
+    except Exception:
+        pass
+
+def _read_tail(path: Path, n: int = 50, window: int = 8192, max_window: int = 1 << 20) -> str:
+    """Last `n` lines of a text file, reading backwards from the end in a bounded window."""
+    try:
+        with open(path, "rb") as f:
+            f.seek(0, os.SEEK_END)
+            end = f.tell()
+            while True:
+                start = max(0, end - window)
+                f.seek(start)
+                chunk = f.read()
+                if chunk.endswith(b"\n"):
+                    chunk = chunk[:-1]
+                lines = chunk.split(b"\n")
+                # Need n+1 pieces so the first (possibly cut) line can be dropped
+                if start == 0 or len(lines) > n or window >= max_window:
+                    break
+                window *= 2
+        if start > 0:
+            lines = lines[1:]
+        return b"\n".join(lines[-n:]).decode("utf-8", errors="ignore").strip()
     except Exception:
         return ""
 
@@ -147,37 +283,30 @@ def _format_insights_markdown(cfg: dict, bstats: dict, tstats: dict) -> str:
         pct_txt = (f" ({pct:+.1f}%)" if pct is not None else "")
         lines.append(f"- Average distance: {fmt_km(b_avg)} → {fmt_km(t_avg)} ({trend}{pct_txt})")
 
-    # Mode-level changes: compute and show top 2 by absolute delta
+    # Mode-level changes: one pass collecting comparable modes, then top 2 by absolute delta
     b_modes = (bstats or {}).get("by_mode", {})
     t_modes = (tstats or {}).get("by_mode", {})
-    def mode_row(m):
+    candidates = []
+    for m in b_modes.keys() | t_modes.keys():
         b = b_modes.get(m, {})
         t = t_modes.get(m, {})
         b_avg_m = km(b.get("avg"))
         t_avg_m = km(t.get("avg"))
-        d = (t_avg_m - b_avg_m) if (b_avg_m is not None and t_avg_m is not None) else None
+        if b_avg_m is None or t_avg_m is None:
+            continue
+        d = t_avg_m - b_avg_m
         b_cnt = b.get("count") or b.get("reachable_count")
         t_cnt = t.get("count") or t.get("reachable_count")
-        return {
-            "mode": m,
-            "b_avg": b_avg_m,
-            "t_avg": t_avg_m,
-            "delta": d,
-            "b_cnt": b_cnt,
-            "t_cnt": t_cnt,
-        }
-    rows = [mode_row(m) for m in set(list(b_modes.keys()) + list(t_modes.keys()))]
-    rows = [r for r in rows if r["b_avg"] is not None and r["t_avg"] is not None]
-    rows.sort(key=lambda r: abs(r["delta"]) if r["delta"] is not None else 0, reverse=True)
-    if rows:
+        candidates.append((abs(d), m, b_avg_m, t_avg_m, d, b_cnt, t_cnt))
+    if candidates:
         lines.append("")
         lines.append("#### By mode (top changes)")
-        for r in rows[:2]:
-            trend = ("improved" if (r["delta"] is not None and r["delta"] < 0) else ("worsened" if (r["delta"] is not None and r["delta"] > 0) else "–"))
+        for _, m, b_avg_m, t_avg_m, d, b_cnt, t_cnt in heapq.nlargest(2, candidates):
+            trend = "improved" if d < 0 else ("worsened" if d > 0 else "–")
             cnt_txt = ""
-            if r["b_cnt"] is not None and r["t_cnt"] is not None and r["b_cnt"] != r["t_cnt"]:
-                cnt_txt = f" (count: {r['b_cnt']} → {r['t_cnt']})"
-            lines.append(f"- {r['mode'].title()}: {fmt_km(r['b_avg'])} → {fmt_km(r['t_avg'])} ({trend}){cnt_txt}")
+            if b_cnt is not None and t_cnt is not None and b_cnt != t_cnt:
+                cnt_txt = f" (count: {b_cnt} → {t_cnt})"
+            lines.append(f"- {m.title()}: {fmt_km(b_avg_m)} → {fmt_km(t_avg_m)} ({trend}){cnt_txt}")
 
     # Why (likely): concise reasons using simple heuristics
     why = []
@@ -275,13 +404,65 @@ def _compact_stats_for_prompt(cfg: dict, bstats: dict, tstats: dict, stderr_tail
 
     return "\n".join(parts)
 
+# job_id -> (source mtimes, (cfg, bstats, tstats, compact_ctx, base_md))
+_INSIGHTS_CTX_CACHE: "OrderedDict[str, tuple[tuple, tuple]]" = OrderedDict()
+_INSIGHTS_CTX_CACHE_MAX = 128
+_INSIGHTS_CTX_SOURCES = ("config.json", "baseline_stats.json", "tramline_stats.json", "stderr.log")
+
+def _build_insights_ctx(job: JobView, jd: Path) -> tuple:
+    cfg = job.config or _read_json_silent(jd / "config.json") or {}
+    bstats = _read_json_silent(jd / "baseline_stats.json")
+    tstats = _read_json_silent(jd / "tramline_stats.json")
+    base_md = _format_insights_markdown(cfg, bstats or {}, tstats or {})
+    # compact prompt context stays in memory (_INSIGHTS_CTX_CACHE), not in the job dir,
+    # which is listed and served to users as artifacts
+    compact = _compact_stats_for_prompt(cfg, bstats, tstats, _read_tail(jd / "stderr.log", n=30))
+    return cfg, bstats, tstats, compact, base_md
+
+def _insights_ctx_sync(job: JobView, jd: Path) -> tuple:
+    key = tuple(_mtime_ns(jd / name) for name in _INSIGHTS_CTX_SOURCES)
+    cached = _lru_get(_INSIGHTS_CTX_CACHE, job.job_id)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+    value = _build_insights_ctx(job, jd)
+    _lru_put(_INSIGHTS_CTX_CACHE, job.job_id, (key, value), _INSIGHTS_CTX_CACHE_MAX)
+    return value
+
+async def _insights_ctx(job: JobView, jd: Path) -> tuple:
+    """(cfg, bstats, tstats, compact_ctx, base_md) for a job, memoized on source file mtimes."""
+    return await to_thread.run_sync(_insights_ctx_sync, job, jd)
+
+# Request IDs are carved from one large urandom read instead of a syscall per request
+_REQID_POOL: deque = deque()
+_REQID_BATCH = 4096
+
+def _next_request_id() -> str:
+    try:
+        return _REQID_POOL.pop()
+    except IndexError:
+        raw = os.urandom(16 * _REQID_BATCH).hex()
+        _REQID_POOL.extend(raw[i:i + 32] for i in range(32, len(raw), 32))
+        return raw[:32]
+
 @app.middleware("http")
 async def add_request_id(request: Request, call_next):
-    request.state.request_id = str(uuid4())
+    request.state.request_id = _next_request_id()
     response = await call_next(request)
     response.headers["x-request-id"] = request.state.request_id
     return response
 
+def _worker_alive(job: JobView) -> Optional[bool]:
+    """Whether the job's simulator process is still running (None if we never launched one)."""
+    if job.pid is None:
+        return None
+    try:
+        os.kill(job.pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
 # -----------------------------------------------------------------------------
 # Health
 # -----------------------------------------------------------------------------
@@ -293,13 +474,13 @@ def health():
 # Simulation endpoints (existing behavior preserved)
 # -----------------------------------------------------------------------------
 @app.post("/v1/submit", response_model=SubmitResponse)
-def submit_job(request: SubmitRequest):
+async def submit_job(request: SubmitRequest):
 
     # ----- 1) Load base template by traffic level -----
     base_cfg_name = "config_off-peak.json" if request.traffic_level == "off-peak" else "config_peak.json"
     base_cfg_path = CONFIG_ROOT / base_cfg_name
-    with open(base_cfg_path, "r") as f:
-        cfg = json.load(f)
+    with open(base_cfg_path, "rb") as f:
+        cfg = _loads(f.read())
 
     # ----- 2) Merge request into template (write all fields simulator needs) -----
     cfg["city"] = request.city
@@ -323,23 +504,33 @@ def submit_job(request: SubmitRequest):
     job_dir.mkdir(parents=True, exist_ok=True)
 
     config_path = job_dir / "config.json"
-    with open(config_path, "w") as f:
-        json.dump(cfg, f, indent=2)
+    config_bytes = _dumps(cfg, indent=True)
+    config_path.write_bytes(config_bytes)
+    _lru_put(_CONFIG_JSON, job_id, config_bytes, _CONFIG_JSON_MAX)
 
     # ----- 4) Launch simulation (non-blocking) -----
     print(f"[Job {job_id}] Launching simulation with {config_path} -> {job_dir}")
-    subprocess.Popen(
-        [
-            sys.executable,
-            str(TRANS_SIM_DIR / "run_sim.py"),
-            "--config", str(config_path),
-            "--outdir", str(job_dir),
-        ],
-        stdout=open(job_dir / "stdout.log", "wb"),
-        stderr=open(job_dir / "stderr.log", "wb"),
-    )
+    log_flags = os.O_WRONLY | os.O_CREAT | os.O_TRUNC
+    fd_out = os.open(job_dir / "stdout.log", log_flags, 0o644)
+    try:
+        fd_err = os.open(job_dir / "stderr.log", log_flags, 0o644)
+        try:
+            proc = await asyncio.create_subprocess_exec(
+                sys.executable,
+                str(TRANS_SIM_DIR / "run_sim.py"),
+                "--config", str(config_path),
+                "--outdir", str(job_dir),
+                stdout=fd_out,
+                stderr=fd_err,
+            )
+        finally:
+            os.close(fd_err)
+    finally:
+        # The child holds its own copies; the API process keeps no log handles open
+        os.close(fd_out)
 
     # Mark running (polling will flip to complete on outputs)
+    job.pid = proc.pid
     job.status = "running"
     job.started_at = datetime.now(timezone.utc)
 
@@ -354,69 +545,72 @@ def submit_job(request: SubmitRequest):
 # Insights (summary + chat)
 # -----------------------------------------------------------------------------
 
+# Fixed prompt scaffolding, built once at import
+_INSIGHTS_SYS = (
+    "You are a transport analyst. Be concise and explanatory. "
+    "Return 4–6 short bullets (<=14 words each). "
+    "Explain reasons behind changes, not just metrics."
+)
+_INSIGHTS_USER_PREFIX = "Context (compact):\n"
+_INSIGHTS_USER_SUFFIX = "\n\nWrite bullets: Outcome, Why, Modes, Traffic, Risks, Action."
+_INSIGHTS_CHAT_SYS = "Answer concisely in Markdown. If unsure, admit uncertainty."
+_INSIGHTS_CHAT_PREFIX = "You are a transport analyst. Summarize and answer using ONLY the provided job context.\n\n"
+
 @app.post("/v1/insights/{job_id}")
-def get_insights(job_id: str):
+async def get_insights(job_id: str):
     job = job_store.get_job(job_id)
     if not job:
         raise HTTPException(status_code=404, detail="Job not found")
     jd = _job_dir(job_id)
-    cfg = job.config or _read_json_silent(jd / "config.json") or {}
-    bstats = _read_json_silent(jd / "baseline_stats.json")
-    tstats = _read_json_silent(jd / "tramline_stats.json")
+    cfg, bstats, tstats, prompt_ctx, base_md = await _insights_ctx(job, jd)
     if not (bstats and tstats):
         raise HTTPException(status_code=400, detail="Required artifacts missing: baseline_stats.json and/or tramline_stats.json")
     # If cached, return
     cache_md = jd / "insights.md"
-    if cache_md.exists():
-        try:
-            text = cache_md.read_text(encoding="utf-8")
-            if text.strip():
-                return {"summary_md": text, "job_id": job_id, "cached": True}
-        except Exception:
-            pass
+    text = await to_thread.run_sync(_read_text_silent, cache_md)
+    if text.strip():
+        return {"summary_md": text, "job_id": job_id, "cached": True}
 
     # Try OpenAI for the first summary, else fallback to rule-based
-    stderr_tail = _read_tail(jd / "stderr.log", n=30)
-    prompt_ctx = _compact_stats_for_prompt(cfg, bstats, tstats, stderr_tail)
-
-    global client
-    client = client or _init_openai()
     used_model = None
     token_usage = None
+    client = await _get_client_async()
     if client is not None:
         try:
             used_model = "gpt-4o-mini"
-            resp = client.chat.completions.create(
+            stream = await client.chat.completions.create(
                 model=used_model,
                 messages=[
-                    {"role": "system", "content": (
-                        "You are a transport analyst. Be concise and explanatory. "
-                        "Return 4–6 short bullets (<=14 words each). "
-                        "Explain reasons behind changes, not just metrics."
-                    )},
-                    {"role": "user", "content": (
-                        "Context (compact):\n" + prompt_ctx + "\n\n"
-                        "Write bullets: Outcome, Why, Modes, Traffic, Risks, Action."
-                    )},
+                    {"role": "system", "content": _INSIGHTS_SYS},
+                    {"role": "user", "content": _INSIGHTS_USER_PREFIX + prompt_ctx + _INSIGHTS_USER_SUFFIX},
                 ],
                 max_tokens=220,
                 temperature=0.2,
+                stream=True,
+                stream_options={"include_usage": True},
             )
-            msg = resp.choices[0].message
-            content = getattr(msg, "content", None)
-            if isinstance(content, list):
-                content = "".join((getattr(p, "text", "") or "") for p in content)
-            md = (content or "").strip()
+            # Collect only the content deltas; usage arrives on the final chunk
+            buf = bytearray()
+            async for event in stream:
+                if event.usage is not None:
+                    token_usage = event.usage
+                if event.choices:
+                    text = event.choices[0].delta.content
+                    if text:
+                        buf += text.encode("utf-8")
+            md = buf.decode("utf-8").strip()
             # Cache and return; if empty, fall back below
             if md:
                 try:
-                    cache_md.write_text(md, encoding="utf-8")
                     meta = {
                         "model": used_model,
                         "ts": datetime.now(timezone.utc).isoformat(),
-                        "usage": getattr(resp, "usage", None) and resp.usage.__dict__,
+                        "usage": token_usage and token_usage.model_dump(),
                     }
-                    (jd / "insights.meta.json").write_text(json.dumps(meta, indent=2), encoding="utf-8")
+                    await asyncio.gather(
+                        to_thread.run_sync(_write_text_silent, cache_md, md),
+                        to_thread.run_sync((jd / "insights.meta.json").write_bytes, _dumps(meta, indent=True)),
+                    )
                 except Exception:
                     pass
                 return {"summary_md": md, "job_id": job_id}
@@ -424,11 +618,8 @@ def get_insights(job_id: str):
             log.warning("LLM insights failed: %s", e)
 
     # Fallback: rule-based summary
-    md = _format_insights_markdown(cfg, bstats, tstats)
-    try:
-        cache_md.write_text(md, encoding="utf-8")
-    except Exception:
-        pass
+    md = base_md
+    await to_thread.run_sync(_write_text_silent, cache_md, md)
     return {"summary_md": md, "job_id": job_id, "cached": False}
 
 
@@ -436,43 +627,93 @@ from pydantic import BaseModel
 
 class InsightsChatRequest(BaseModel):
     query: str
+    # Opt-in: reply as Server-Sent Events (one `data:` line per token chunk)
+    stream: bool = False
+
+def _sse_event(payload) -> bytes:
+    return b"data: " + _dumps(payload) + b"\n\n"
+
+async def _sse_single(md: str):
+    yield _sse_event({"delta": md})
+    yield b"data: [DONE]\n\n"
+
+async def _stream_reply_sse(chunks, fallback_md: str):
+    """Forward OpenAI delta chunks as SSE; fall back to `fallback_md` if nothing arrives."""
+    sent = False
+    try:
+        async for chunk in chunks:
+            if not chunk.choices:
+                continue
+            text = chunk.choices[0].delta.content
+            if text:
+                sent = True
+                yield _sse_event({"delta": text})
+    except Exception as e:
+        log.warning("insights chat stream failed: %s", e)
+    if not sent:
+        yield _sse_event({"delta": fallback_md})
+    yield b"data: [DONE]\n\n"
 
 @app.post("/v1/insights/{job_id}/chat")
-def insights_chat(job_id: str, req: InsightsChatRequest):
+async def insights_chat(job_id: str, req: InsightsChatRequest):
     job = job_store.get_job(job_id)
     if not job:
         raise HTTPException(status_code=404, detail="Job not found")
     jd = _job_dir(job_id)
-    cfg = job.config or _read_json_silent(jd / "config.json") or {}
-    bstats = _read_json_silent(jd / "baseline_stats.json")
-    tstats = _read_json_silent(jd / "tramline_stats.json")
-    base_md = _format_insights_markdown(cfg, bstats or {}, tstats or {})
+    cfg, bstats, tstats, _, base_md = await _insights_ctx(job, jd)
 
     # Try OpenAI if available, else return a friendly fallback
-    global client
-    client = client or _init_openai()
+    client = await _get_client_async()
     if client is None:
         reply = (
             "Chat is not configured (no API key).\n\n"
             "Here’s a recap based on the job: \n\n" + base_md
         )
+        if req.stream:
+            return StreamingResponse(_sse_single(reply), media_type="text/event-stream")
         return {"reply_md": reply}
 
-    # Compose a constrained prompt
+    # Compose a constrained prompt; the job files are already JSON, splice them in as-is
+    bstats_json, tstats_json = await asyncio.gather(
+        to_thread.run_sync(_raw_json_text, jd / "baseline_stats.json", bstats),
+        to_thread.run_sync(_raw_json_text, jd / "tramline_stats.json", tstats),
+    )
+    cfg_bytes = _lru_get(_CONFIG_JSON, job_id)
+    if cfg_bytes is not None:
+        cfg_json = cfg_bytes.decode()
+    else:
+        cfg_json = await to_thread.run_sync(_raw_json_text, jd / "config.json", cfg)
     ctx = (
-        "You are a transport analyst. Summarize and answer using ONLY the provided job context.\n\n"
-        f"Job config (JSON):\n{json.dumps(cfg, indent=2)}\n\n"
-        f"Baseline stats (JSON):\n{json.dumps(bstats or {}, indent=2)}\n\n"
-        f"Tramline stats (JSON):\n{json.dumps(tstats or {}, indent=2)}\n\n"
+        _INSIGHTS_CHAT_PREFIX
+        + f"Job config (JSON):\n{cfg_json}\n\n"
+        f"Baseline stats (JSON):\n{bstats_json}\n\n"
+        f"Tramline stats (JSON):\n{tstats_json}\n\n"
         f"User question: {req.query}\n"
     )
+    messages = [
+        {"role": "system", "content": _INSIGHTS_CHAT_SYS},
+        {"role": "user", "content": ctx},
+    ]
+    if req.stream:
+        try:
+            chunks = await client.chat.completions.create(
+                model="gpt-4o-mini",
+                messages=messages,
+                max_tokens=500,
+                temperature=0.2,
+                stream=True,
+            )
+        except Exception as e:
+            log.warning("insights chat failed: %s", e)
+            chunks = None
+        if chunks is None:
+            return StreamingResponse(_sse_single(base_md), media_type="text/event-stream")
+        return StreamingResponse(_stream_reply_sse(chunks, base_md), media_type="text/event-stream")
+
     try:
-        resp = client.chat.completions.create(
+        resp = await client.chat.completions.create(
             model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": "Answer concisely in Markdown. If unsure, admit uncertainty."},
-                {"role": "user", "content": ctx},
-            ],
+            messages=messages,
             max_tokens=500,
             temperature=0.2,
         )
@@ -501,40 +742,50 @@ def get_status(job_id: str):
         raise HTTPException(status_code=404, detail="Job not found")
 
     job_dir = JOBS_ROOT / job_id
+    # Check liveness before scanning so outputs written just before exit are seen
+    worker_alive = _worker_alive(job)
 
-    def _exists_nonempty(path: Path) -> bool:
-        try:
-            return path.exists() and path.stat().st_size > 0
-        except Exception:
-            return False
+    # One directory pass: name -> size for every file currently in the job dir
+    sizes: dict[str, int] = {}
+    try:
+        with os.scandir(job_dir) as it:
+            for e in it:
+                try:
+                    if e.is_file():
+                        sizes[e.name] = e.stat().st_size
+                except OSError:
+                    pass
+    except OSError:
+        pass
+
+    def _exists_nonempty(name: str) -> bool:
+        return sizes.get(name, 0) > 0
 
     # Required outputs: both stats, baseline map, and at least one tram map
     required_all = [
-        job_dir / "baseline_stats.json",
-        job_dir / "tramline_stats.json",
-        job_dir / "baseline_access.html",
+        "baseline_stats.json",
+        "tramline_stats.json",
+        "baseline_access.html",
     ]
     optional_any = [
-        job_dir / "tramline_access_colored.html",
-        job_dir / "tramline_access.html",
+        "tramline_access_colored.html",
+        "tramline_access.html",
     ]
 
-    have_all = all(_exists_nonempty(p) for p in required_all) and any(
-        _exists_nonempty(p) for p in optional_any
+    have_all = all(_exists_nonempty(n) for n in required_all) and any(
+        _exists_nonempty(n) for n in optional_any
     )
 
     # Compute diagnostics
-    elapsed = int(max(0, (datetime.now(timezone.utc) - job.submitted_at).total_seconds()))
-    missing = [p.name for p in required_all if not _exists_nonempty(p)]
-    stderr_path = job_dir / "stderr.log"
+    max_wait = _max_status_wait()
+    elapsed = int(max(0, time.monotonic() - job.submitted_mono))
+    missing = [n for n in required_all if not _exists_nonempty(n)]
     stderr_text = ""
     has_error = False
-    if _exists_nonempty(stderr_path):
+    if _exists_nonempty("stderr.log"):
         try:
-            # Read last ~80 lines for a quick summary
-            with open(stderr_path, "r", encoding="utf-8", errors="ignore") as f:
-                lines = f.readlines()[-80:]
-            stderr_text = "".join(lines)
+            # Read last ~80 lines for a quick summary (bounded tail read)
+            stderr_text = _read_tail(job_dir / "stderr.log", n=80, window=16 * 1024)
             ht = stderr_text.lower()
             has_error = ("traceback" in ht) or ("error" in ht) or ("exception" in ht)
         except Exception:
@@ -542,62 +793,68 @@ def get_status(job_id: str):
 
     message = None
     partial = False
+    # The store hands out a read-only view; the outcome below is per-response
+    status, finished_at = job.status, job.finished_at
 
     # Only mark complete when ALL required artifacts are present
     if have_all:
-        if job.status != "complete":
-            job.status = "complete"
-            job.finished_at = datetime.now(timezone.utc)
+        if status != "complete":
+            status = "complete"
+            finished_at = datetime.now(timezone.utc)
         message = "All artifacts are ready."
     else:
-        # If within wait window, remain running; provide a helpful message
-        if elapsed < MAX_STATUS_WAIT_SEC:
+        # If within wait window (and the simulator hasn't exited), remain running
+        if elapsed < max_wait and worker_alive is not False:
             # If store prematurely flipped to complete, override to running
-            if job.status == "complete":
-                job.status = "running"
-                job.finished_at = None
+            if status == "complete":
+                status = "running"
+                finished_at = None
             if has_error:
                 message = "Errors detected, still processing. Waiting for outputs…"
             else:
                 message = "Generating outputs. This may take a moment…"
         else:
-            # Past the wait window. If we have any artifacts, return complete with partial flag
-            any_artifacts = any(_exists_nonempty(p) for p in required_all + optional_any)
+            # Past the wait window, or the simulator exited early. If we have any artifacts,
+            # return complete with partial flag
+            exited = elapsed < max_wait  # we only get here before the deadline if it exited
+            any_artifacts = any(_exists_nonempty(n) for n in required_all + optional_any)
             if any_artifacts:
-                job.status = "complete"
+                status = "complete"
                 partial = True
-                if job.finished_at is None:
-                    job.finished_at = datetime.now(timezone.utc)
+                if finished_at is None:
+                    finished_at = datetime.now(timezone.utc)
                 if has_error:
                     message = "Partial results available (errors were logged)."
                 else:
-                    message = "Partial results available after timeout."
+                    message = ("Partial results available (simulator exited)." if exited
+                               else "Partial results available after timeout.")
             else:
                 # Nothing produced; mark failed with an explanation
-                job.status = "failed"
+                status = "failed"
                 if has_error and stderr_text:
                     # Provide a short friendly summary
                     message = "Simulation failed. See stderr.log for details."
                 else:
-                    message = "Timed out waiting for results."
+                    message = ("Simulator exited without producing outputs." if exited
+                               else "Timed out waiting for results.")
 
     # Always rebuild artifacts in the shape the model expects
-    job.artifacts = _list_artifacts(job_id)
+    artifacts = _list_artifacts(job_id)
 
     return StatusResponse(
         job_id=job.job_id,
-        status=job.status,
+        status=status,
         submitted_at=job.submitted_at,
         started_at=job.started_at,
-        finished_at=job.finished_at,
+        finished_at=finished_at,
         progress=job.progress,
-        artifacts=job.artifacts,
+        artifacts=artifacts,
         config=job.config,
         message=message,
         partial=partial or None,
         error=has_error or None,
         missing=(missing or None),
-        timeout_sec=MAX_STATUS_WAIT_SEC,
+        timeout_sec=max_wait,
         elapsed_sec=elapsed,
     )
 
@@ -610,9 +867,14 @@ def get_status(job_id: str):
 THIS_DIR = os.path.dirname(__file__)
 ROOT_DIR = os.path.abspath(os.path.join(THIS_DIR, ".."))
 PROJECT_DOCS_DIR = os.path.join(ROOT_DIR, "project_docs")
+# Persisted embeddings; sources.json records the doc mtimes they were built from.
+# Kept out of DATA_ROOT, which is served publicly under /files.
+RAG_INDEX_DIR = Path(ROOT_DIR) / ".cache" / "rag_index"
+RAG_SOURCES_PATH = RAG_INDEX_DIR / "sources.json"
+RAG_CONTEXT_MAX_BYTES = 8 * 1024  # cap on retrieved context sent to the model
 
 _index: Optional["VectorStoreIndex"] = None
-client: Optional[OpenAI] = None
+_index_lock = threading.Lock()  # startup warmup and the first chat may race to build
 
 SYSTEM_PROMPT = (
     "You are a technical assistant for THIS project only. "
@@ -620,49 +882,128 @@ SYSTEM_PROMPT = (
     "'Sorry, I don't have enough context to answer that. Please contact the author Obaid Malik'. "
     "When relevant, include exact file names, relative paths, and small code snippets."
 )
+RAG_USER_SUFFIX = "\nAnswer using ONLY the context above. If the answer is not in the context, refuse."
+
+def _make_http_client():
+    import httpx
+
+    # Shared keep-alive pool so TLS handshakes are amortized across LLM calls
+    kwargs = dict(
+        limits=httpx.Limits(max_keepalive_connections=32, max_connections=64),
+        timeout=httpx.Timeout(30.0, connect=5.0),
+    )
+    try:
+        return httpx.AsyncClient(http2=True, **kwargs)
+    except ImportError:  # h2 not installed; HTTP/1.1 still pools connections
+        return httpx.AsyncClient(**kwargs)
 
-def _init_openai() -> Optional[OpenAI]:
+def _init_openai() -> Optional["AsyncOpenAI"]:
     api_key = os.getenv("OPENAI_API_KEY", "").strip()
     if not api_key:
         log.warning("OPENAI_API_KEY not set; chat will return a friendly fallback.")
         return None
     try:
-        return OpenAI(api_key=api_key)
+        from openai import AsyncOpenAI
+        return AsyncOpenAI(api_key=api_key, http_client=_make_http_client())
     except Exception as e:
         log.warning("Failed to initialize OpenAI client: %s", e)
         return None
 
+# Process-wide client, created once on first use (None when no API key is configured)
+client: Optional["AsyncOpenAI"] = None
+_client_ready = False
+_client_lock = threading.Lock()
+
+def _get_client() -> Optional["AsyncOpenAI"]:
+    global client, _client_ready
+    if not _client_ready:
+        with _client_lock:
+            if not _client_ready:
+                client = _init_openai()
+                _client_ready = True
+    return client
+
+async def _get_client_async() -> Optional["AsyncOpenAI"]:
+    """_get_client for async endpoints: the cold path (import, lock wait) runs off the event loop."""
+    if _client_ready:
+        return client
+    return await to_thread.run_sync(_get_client)
+
+@lru_cache(maxsize=1)
+def _llama_index_core():
+    """The llama_index.core module, or None when LlamaIndex isn't installed (import tried once)."""
+    try:
+        import llama_index.core as core
+        return core
+    except Exception:
+        return None
+
+def _docs_fingerprint() -> dict:
+    out = {}
+    for dirpath, _, files in os.walk(PROJECT_DOCS_DIR):
+        for name in files:
+            p = os.path.join(dirpath, name)
+            out[os.path.relpath(p, PROJECT_DOCS_DIR)] = os.stat(p).st_mtime_ns
+    return out
+
+def _load_persisted_index(core, sources: dict) -> Optional["VectorStoreIndex"]:
+    if _read_json_silent(RAG_SOURCES_PATH) != sources:
+        return None  # never built, or project_docs changed since
+    try:
+        storage = core.StorageContext.from_defaults(persist_dir=str(RAG_INDEX_DIR))
+        return core.load_index_from_storage(storage)
+    except Exception as e:
+        log.warning("Failed to load persisted RAG index, rebuilding: %s", e)
+        return None
+
 def _load_index_once() -> Optional["VectorStoreIndex"]:
+    if _index is not None:
+        return _index
+    with _index_lock:
+        return _load_index_locked()
+
+def _load_index_locked() -> Optional["VectorStoreIndex"]:
     global _index
     if _index is not None:
         return _index
-    if VectorStoreIndex is None or SimpleDirectoryReader is None:
+    core = _llama_index_core()
+    if core is None:
         log.warning("LlamaIndex not available; RAG disabled.")
         return None
     if not os.path.isdir(PROJECT_DOCS_DIR):
         log.warning("project_docs folder not found at %s; RAG disabled.", PROJECT_DOCS_DIR)
         return None
     try:
-        docs = SimpleDirectoryReader(PROJECT_DOCS_DIR).load_data()
+        sources = _docs_fingerprint()
+        index = _load_persisted_index(core, sources)
+        if index is not None:
+            _index = index
+            log.info("RAG index loaded from %s", RAG_INDEX_DIR)
+            return _index
+        docs = core.SimpleDirectoryReader(PROJECT_DOCS_DIR).load_data()
         if not docs:
             log.warning("project_docs is empty; RAG disabled.")
             return None
-        _index = VectorStoreIndex.from_documents(docs)
+        _index = core.VectorStoreIndex.from_documents(docs)
         log.info("RAG index built from %d document(s) in %s", len(docs), PROJECT_DOCS_DIR)
+        try:
+            _index.storage_context.persist(persist_dir=str(RAG_INDEX_DIR))
+            RAG_SOURCES_PATH.write_bytes(_dumps(sources, indent=True))
+        except Exception as e:
+            log.warning("Failed to persist RAG index: %s", e)
         return _index
     except Exception as e:
         log.warning("Failed to build RAG index: %s", e)
         return None
 
-def _answer_with_rag(user_query: str) -> str:
+async def _answer_with_rag(user_query: str) -> str:
     """
     Retrieve context from the index (if available) and answer with OpenAI.
     When anything is missing (index/client/docs), degrade gracefully with a scoped fallback.
     """
     # Ensure OpenAI client + index are available
-    global client
-    client = client or _init_openai()
-    index = _load_index_once()
+    client = await _get_client_async()
+    index = await to_thread.run_sync(_load_index_once)
 
     if not user_query.strip():
         return "Please type a question."
@@ -674,26 +1015,32 @@ def _answer_with_rag(user_query: str) -> str:
     # Retrieve top-K context
     try:
         retriever = index.as_retriever(similarity_top_k=3)
-        nodes = retriever.retrieve(user_query)
-        context_texts = [getattr(n, "text", "").strip() for n in nodes if getattr(n, "text", "").strip()]
-        joined = " ".join(context_texts)
-        if not context_texts or len(joined) < 20:
+        nodes = await retriever.aretrieve(user_query)
+        # One pass: append node texts until the byte budget is spent
+        buf = bytearray()
+        for n in nodes:
+            text = (getattr(n, "text", "") or "").strip()
+            if not text:
+                continue
+            sep = b"\n\n" if buf else b""
+            room = RAG_CONTEXT_MAX_BYTES - len(buf) - len(sep)
+            if room <= 0:
+                break
+            buf += sep
+            buf += text.encode("utf-8")[:room]
+        if len(buf) < 20:
             return "Sorry, I only answer questions about this project."
-        context_block = "\n\n".join(context_texts)
+        context_block = buf.decode("utf-8", errors="ignore")
     except Exception as e:
         log.warning("RAG retrieval failed: %s", e)
         return "Sorry, I only answer questions about this project."
 
     # Compose prompts
-    user_prompt = (
-        f"Context:\n{context_block}\n\n"
-        f"User question: {user_query}\n"
-        f"Answer using ONLY the context above. If the answer is not in the context, refuse."
-    )
+    user_prompt = "Context:\n" + context_block + "\n\nUser question: " + user_query + RAG_USER_SUFFIX
 
     # OpenAI (new 1.x client)
     try:
-        resp = client.chat.completions.create(
+        resp = await client.chat.completions.create(
             model="gpt-4o-mini",
             messages=[
                 {"role": "system", "content": SYSTEM_PROMPT},
@@ -716,24 +1063,28 @@ def _answer_with_rag(user_query: str) -> str:
         log.warning("OpenAI call failed: %s", e)
         return f"Sorry, there was an error contacting the model: {e}"
 
-@app.on_event("startup")
-def _warm_start():
+def _warm_llm():
     # Non-fatal warmup; we keep serving even if these fail
     try:
-        _ = _init_openai()
+        _ = _get_client()
         _ = _load_index_once()
     except Exception as e:
         log.warning("Startup warmup issues: %s", e)
 
+@app.on_event("startup")
+def _warm_start():
+    # Warm in the background so the worker starts serving immediately
+    threading.Thread(target=_warm_llm, name="llm-warmup", daemon=True).start()
+
 @app.post("/v1/chat", response_model=ChatResponse)
-def chat(req: ChatRequest):
+async def chat(req: ChatRequest):
     """
     Chat endpoint: accepts {messages:[{role,content}...]} and returns
     { "message": { "role": "assistant", "content": "..." } }
     """
     try:
         user_text = req.messages[-1].content
-        answer = _answer_with_rag(user_text)
+        answer = await _answer_with_rag(user_text)
         return ChatResponse(message=ChatMessage(role="assistant", content=answer))
     except HTTPException:
         raise
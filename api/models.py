@@ -1,5 +1,5 @@
-from pydantic import BaseModel, Field, field_validator
-from typing import List, Optional, Literal, Dict
+from pydantic import BaseModel, ConfigDict, Field, field_validator, model_serializer
+from typing import Any, List, Optional, Literal, Dict
 from datetime import datetime
 
 Status = Literal["queued", "running", "complete", "failed"]
@@ -41,6 +41,31 @@ class Artifact(BaseModel):
     name: str
     url: str
 
+# Known keys get typed validators; anything else in the job's config/metrics
+# is passed through untouched so the UI keeps seeing the full merged config.
+class _PassThrough(BaseModel):
+    model_config = ConfigDict(extra="allow")
+
+    # Only echo keys the job actually had, so absent ones don't show up as null.
+    @model_serializer(mode="wrap")
+    def _present_keys_only(self, handler):
+        data = handler(self)
+        return {k: v for k, v in data.items() if k in self.model_fields_set}
+
+class JobMetrics(_PassThrough):
+    agents: Optional[int] = None
+    avg_travel_time_s: Optional[float] = None
+
+class JobConfig(_PassThrough):
+    city: Optional[str] = None
+    num_agents: Optional[int] = None
+    agent_distribution: Optional[Dict[str, int]] = None
+    traffic: Optional[str] = None
+    tramline: Optional[List[str]] = None
+    scenarios: Optional[Dict[str, Dict[str, Any]]] = None
+    sim_date: Optional[str] = None
+    sim_time: Optional[str] = None
+
 class StatusResponse(BaseModel):
     job_id: str
     status: Status
@@ -48,10 +73,10 @@ class StatusResponse(BaseModel):
     submitted_at: datetime
     started_at: Optional[datetime] = None
     finished_at: Optional[datetime] = None
-    metrics: Optional[Dict] = None
+    metrics: Optional[JobMetrics] = None
     artifacts: List[Artifact] = []
     # Include the job's config so the UI can read city/agents/traffic
-    config: Optional[Dict] = None
+    config: Optional[JobConfig] = None
     # New: user-facing message and diagnostics
     message: Optional[str] = None
     partial: Optional[bool] = None
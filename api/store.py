@@ -1,9 +1,15 @@
 from __future__ import annotations
+import sys
+import threading
+import time
 from dataclasses import dataclass, field
 from datetime import datetime, timedelta, timezone
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
 
-@dataclass
+# Slotted on 3.10+ (no per-job __dict__); the pinned deps still allow 3.9, where it stays a plain dataclass
+_SLOTS = {"slots": True} if sys.version_info >= (3, 10) else {}
+
+@dataclass(**_SLOTS)
 class Job:
     job_id: str
     submitted_at: datetime
@@ -14,44 +20,64 @@ class Job:
     config: dict = field(default_factory=dict)
     metrics: dict = field(default_factory=dict)
     artifacts: List[dict] = field(default_factory=list)
+    pid: Optional[int] = None       # simulator process, once launched
+    submitted_mono: float = field(default_factory=time.monotonic)  # for elapsed-time math; submitted_at is for display
+
+# Local timeline: 0-2s queued, 2-12s running, 12s+ complete
+_QUEUED_S = 2.0
+_RUNNING_S = 10.0
+_QUEUED_FOR = timedelta(seconds=_QUEUED_S)
+_RUNNING_FOR = timedelta(seconds=_RUNNING_S)
+
+def _derive_status(submitted_at: datetime, elapsed: float) -> Tuple[str, int, Optional[datetime], Optional[datetime]]:
+    """Pure timeline lookup: (status, progress, started_at, finished_at) `elapsed` seconds after submit."""
+    if elapsed < _QUEUED_S:
+        return "queued", 0, None, None
+    started = submitted_at + _QUEUED_FOR
+    if elapsed < _QUEUED_S + _RUNNING_S:
+        return "running", min(99, int((elapsed - _QUEUED_S) / _RUNNING_S * 100)), started, None  # 0..99
+    return "complete", 100, started, started + _RUNNING_FOR
+
+class JobView:
+    """Read-only view of a stored Job: timeline-derived status fields, the rest read through."""
+    __slots__ = ("_job", "status", "progress", "started_at", "finished_at")
+
+    def __init__(self, job: Job, status: str, progress: int,
+                 started_at: Optional[datetime], finished_at: Optional[datetime]):
+        for name, value in (("_job", job), ("status", status), ("progress", progress),
+                            ("started_at", started_at), ("finished_at", finished_at)):
+            object.__setattr__(self, name, value)
+
+    def __getattr__(self, name):
+        # only reached for names not in __slots__
+        return getattr(self._job, name)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"JobView is read-only (tried to set {name!r})")
 
 class InMemoryStore:
     def __init__(self):
         self.jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()   # guards mutation of `jobs`; reads are plain dict lookups
 
     def create_job(self, job_id: str, config: dict) -> Job:
         now = datetime.now(timezone.utc)
         job = Job(job_id=job_id, submitted_at=now, config=config, status="queued", progress=0)
-        self.jobs[job_id] = job
+        with self._lock:
+            self.jobs[job_id] = job
         return job
 
-    def get_job(self, job_id: str) -> Optional[Job]:
+    def get_job(self, job_id: str) -> Optional[JobView]:
+        """
+        Returns a read-only view of the job with the timeline applied. Only the four
+        derived fields are computed; everything else reads through to the stored job,
+        so a status poll copies nothing and never writes to shared state.
+        """
         job = self.jobs.get(job_id)
         if not job:
             return None
 
-        # Auto-progress locally based on time since submitted
-        now = datetime.now(timezone.utc)
-        elapsed = (now - job.submitted_at).total_seconds()
-        # Timeline: 0-2s queued, 2-12s running, 12s+ complete
-        if elapsed < 2:
-            job.status = "queued"; job.progress = 0
-        elif elapsed < 12:
-            job.status = "running"
-            job.progress = min(99, int((elapsed - 2) / 10 * 100))  # 0..99
-            job.started_at = job.started_at or (job.submitted_at + timedelta(seconds=2))
-        else:
-            job.status = "complete"
-            job.progress = 100
-            job.started_at = job.started_at or (job.submitted_at + timedelta(seconds=2))
-            job.finished_at = job.finished_at or (job.submitted_at + timedelta(seconds=12))
-            # if not job.artifacts:
-            #     # Dummy artifacts
-            #     job.artifacts = [
-            #         {"name": "routes.csv", "url": "https://example.com/artifacts/routes.csv"},
-            #         {"name": "metrics.json", "url": "https://example.com/artifacts/metrics.json"},
-            #     ]
-            #     job.metrics = {"agents": job.config.get("num_agents", 0), "avg_travel_time_s": 312.4}
-        return job
+        status, progress, started_at, finished_at = _derive_status(job.submitted_at, time.monotonic() - job.submitted_mono)
+        return JobView(job, status, progress, job.started_at or started_at, job.finished_at or finished_at)
 
 STORE = InMemoryStore()
@@ -5,7 +5,7 @@ build_cities.py — Offline builder for demo cities
 Purpose
 -------
 One-time script to generate:
-  1) Precomputed graphs per city: transport_sim/data/graphs/{slug}.gpickle
+  1) Precomputed graphs per city: transport_sim/data/graphs/{slug}.graph/ (column arrays, see write_graph_arrays)
   2) UI dataset: web/assets/data/cities.json
   3) (Optional) Simulator stops lookup per city: transport_sim/data/stops/{slug}.json
 
@@ -47,11 +47,17 @@ cities:
 
 Notes
 -----
-• Requires: osmnx>=1.3, networkx, shapely, pyproj, geopandas, pandas, pyyaml (if using YAML seed)
+• Requires: osmnx>=1.3, networkx, numpy, orjson, shapely, pyproj, geopandas, pandas, pyyaml (if using YAML seed)
 • OSM data © OpenStreetMap contributors (ODbL). Include attribution in your README.
+• --workers N builds N cities at once (default 1). City boundaries are geocoded up front in
+  the main process, and the workers' Nominatim stop fallbacks take turns through a shared
+  lock, so Nominatim still sees at most one request per second; Overpass queries do run
+  concurrently, so keep N small.
 """
 
-import argparse, json, sys, os, pickle
+import argparse, sys, os
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
 # Optional YAML support
@@ -61,31 +67,79 @@ except Exception:
     yaml = None
 
 import math
+import numpy as np
+import orjson
 import pandas as pd
+import geopandas as gpd
 import networkx as nx
 import osmnx as ox
 from shapely.geometry import shape
 from shapely.geometry.base import BaseGeometry
 
 
-def write_graph_pickle(G, path):
+def _first(val):
+    # simplified OSMnx edges carry a list when the merged ways disagree; keep the first
+    return val[0] if isinstance(val, list) and val else val
+
+def _maxspeed_kmh(val) -> float:
+    # OSM maxspeed: "30", "30 mph", "none", "signals", ... -> km/h, NaN if not numeric
+    val = str(_first(val) or "").strip().lower()
+    num = val.split()[0] if val else ""
+    try:
+        speed = float(num)
+    except ValueError:
+        return float("nan")
+    return speed * 1.609344 if val.endswith("mph") else speed
+
+def write_graph_arrays(G, path):
+    """
+    Save G column-wise into directory `path`:
+      ids.npy      int64[N]     node ids
+      xy.npy       float64[N,2] node (x, y) = (lon, lat)
+      u/v/key.npy  int64[E]     edge endpoints (+ multigraph key)
+      length.npy   float32[E]   edge length (m)
+      highway.npy  str[E]       OSM highway class ("" if missing)
+      maxspeed.npy float32[E]   speed limit in km/h (NaN if missing/non-numeric)
+      meta.json    directed/multigraph flags + scalar graph attrs (crs, simplified)
+    Plain .npy files (not .npz) so they can be memory-mapped.
+    """
     path = Path(path)
-    path.parent.mkdir(parents=True, exist_ok=True)
-    with path.open("wb") as fh:
-        pickle.dump(G, fh, protocol=pickle.HIGHEST_PROTOCOL)
+    path.mkdir(parents=True, exist_ok=True)
 
-def read_graph_pickle(path):
-    with open(path, "rb") as fh:
-        return pickle.load(fh)
+    nodes = list(G.nodes(data=True))
+    ids = np.fromiter((n for n, _ in nodes), dtype=np.int64, count=len(nodes))
+    xy = np.array([(d.get("x", np.nan), d.get("y", np.nan)) for _, d in nodes], dtype=np.float64).reshape(-1, 2)
+
+    if G.is_multigraph():
+        edges = list(G.edges(keys=True, data=True))
+    else:
+        edges = [(u, v, 0, d) for u, v, d in G.edges(data=True)]
+    u = np.fromiter((e[0] for e in edges), dtype=np.int64, count=len(edges))
+    v = np.fromiter((e[1] for e in edges), dtype=np.int64, count=len(edges))
+    key = np.fromiter((e[2] for e in edges), dtype=np.int64, count=len(edges))
+    length = np.fromiter((e[3].get("length", np.nan) for e in edges), dtype=np.float32, count=len(edges))
+    highway = np.array([str(_first(e[3].get("highway")) or "") for e in edges], dtype=np.str_)
+    maxspeed = np.fromiter((_maxspeed_kmh(e[3].get("maxspeed")) for e in edges), dtype=np.float32, count=len(edges))
+
+    for name, arr in (("ids", ids), ("xy", xy), ("u", u), ("v", v), ("key", key),
+                      ("length", length), ("highway", highway), ("maxspeed", maxspeed)):
+        np.save(path / f"{name}.npy", arr)
+
+    meta = {
+        "directed": G.is_directed(),
+        "multigraph": G.is_multigraph(),
+        "graph": {k: G.graph[k] for k in ("crs", "simplified") if k in G.graph},
+    }
+    (path / "meta.json").write_bytes(orjson.dumps(meta, default=str))
 
 def load_seed(path: Path):
-    text = Path(path).read_text(encoding="utf-8")
+    raw = Path(path).read_bytes()
     if path.suffix.lower() in (".yml", ".yaml"):
         if yaml is None:
             raise RuntimeError("pyyaml is required to read YAML seeds. pip install pyyaml")
-        data = yaml.safe_load(text)
+        data = yaml.safe_load(raw.decode("utf-8"))
     else:
-        data = json.loads(text)
+        data = orjson.loads(raw)
     if not isinstance(data, dict) or "cities" not in data:
         raise ValueError("Seed must be an object with a top-level 'cities' list")
     return data["cities"]
@@ -105,12 +159,12 @@ def polygon_from_seed(city):
     if "polygon" in city and city["polygon"]:
         poly = city["polygon"]
         if isinstance(poly, str) and Path(poly).exists():
-            gj = json.loads(Path(poly).read_text(encoding="utf-8"))
+            gj = orjson.loads(Path(poly).read_bytes())
             geom = shape(gj["features"][0]["geometry"]) if "features" in gj else shape(gj["geometry"])
-            gdf = ox.geocoder.geocode_to_gdf(geom.wkt)  # wrap into gdf with CRS
+            gdf = gpd.GeoDataFrame({"geometry": [geom]}, crs="EPSG:4326")  # GeoJSON is lon/lat
         elif isinstance(poly, (dict, list)):
             geom = shape(poly) if isinstance(poly, dict) else shape({"type": "Polygon", "coordinates": poly})
-            gdf = ox.geocoder.geocode_to_gdf(geom.wkt)
+            gdf = gpd.GeoDataFrame({"geometry": [geom]}, crs="EPSG:4326")
         else:
             raise ValueError("Unsupported 'polygon' in seed for city: {}".format(city.get("name")))
     else:
@@ -122,74 +176,229 @@ def polygon_from_seed(city):
     gdf = buffer_geom_m(gdf, buf_km)
     return gdf
 
-def graph_for_city(polygon_gdf, network: str):
+def graph_for_city(polygon_geom, network: str):
     # Typical choices: 'drive', 'walk', 'bike'
     ox.settings.log_console = True
-    G = ox.graph_from_polygon(polygon_gdf.geometry.iloc[0], network_type=network, simplify=True)
+    G = ox.graph_from_polygon(polygon_geom, network_type=network, simplify=True)
     return G
 
-def geocode_name_in_poly(name: str, polygon_gdf):
-    # Try to find a POI matching the name inside polygon (stations/tram/metro)
-    tags_list = [
-        {"railway": ["station", "halt", "stop", "tram_stop"]},
-        {"public_transport": ["station", "stop_position", "stop_area"]},
-        {"subway": True},
-    ]
-    geom = polygon_gdf.geometry.iloc[0]
-    for tags in tags_list:
-        try:
-            gdf = ox.features.features_from_polygon(geom, tags)
-            if gdf is not None and len(gdf):
-                # fuzzy match by case-insensitive containment
-                gdf["name_lower"] = gdf.get("name", "").astype(str).str.lower()
-                target = name.strip().lower()
-                hits = gdf[gdf["name_lower"].str.contains(target, na=False)]
-                if len(hits):
-                    row = hits.iloc[0]
-                    pt = row.geometry.representative_point()
-                    return float(pt.y), float(pt.x)
-        except Exception:
-            continue
+# Tag sets tried for preferred stops, in priority order
+STOP_TAGS_LIST = [
+    {"railway": ["station", "halt", "stop", "tram_stop"]},
+    {"public_transport": ["station", "stop_position", "stop_area"]},
+    {"subway": True},
+]
+
+def fetch_stop_pois(polygon_geom):
+    """
+    One Overpass query for the union of STOP_TAGS_LIST inside the polygon.
+    Adds `name_lower` and `tag_rank` (index of the first tag set the row matches).
+    Returns None if nothing (named) was found or the query failed.
+    """
+    merged = {}
+    for tags in STOP_TAGS_LIST:
+        merged.update(tags)
+    try:
+        gdf = ox.features.features_from_polygon(polygon_geom, merged)
+    except Exception:
+        return None
+    if gdf is None or not len(gdf) or "name" not in gdf:
+        return None
+    # Keep only the columns used below (OSM features come back with hundreds of tag columns)
+    gdf = gdf[["name", "geometry"] + [k for k in merged if k in gdf]].dropna(subset=["name"]).copy()
+    gdf["name_lower"] = gdf["name"].astype(str).str.lower()
+    rank = pd.Series(len(STOP_TAGS_LIST), index=gdf.index)
+    for i, tags in reversed(list(enumerate(STOP_TAGS_LIST))):
+        for key, val in tags.items():
+            if key not in gdf:
+                continue
+            hit = gdf[key].notna() if val is True else gdf[key].isin(val)
+            rank[hit] = i
+    gdf["tag_rank"] = rank
+    return gdf
+
+def match_stop_names(pois, names):
+    """
+    {name: (lat, lon)} for every name found in `pois` (from fetch_stop_pois) by
+    case-insensitive containment; earlier tag sets win. One C-level np.char.find
+    sweep per name over a names array built once.
+    """
+    if pois is None or not len(pois):
+        return {}
+    hay = pois["name_lower"].to_numpy(dtype=str)
+    rank = pois["tag_rank"].to_numpy()
+    geoms = pois.geometry.to_numpy()
+    out = {}
+    for name in names:
+        hits = np.flatnonzero(np.char.find(hay, name.strip().lower()) >= 0)
+        if len(hits):
+            pt = geoms[hits[rank[hits].argmin()]].representative_point()
+            out[name] = (float(pt.y), float(pt.x))
+    return out
+
+# Set in --workers processes (see _init_worker): OSMnx only spaces out Nominatim
+# requests within one process, so workers take turns through this shared lock.
+_NOMINATIM_LOCK = None
+
+def _init_worker(lock):
+    global _NOMINATIM_LOCK
+    _NOMINATIM_LOCK = lock
+
+def geocode_name_nominatim(name: str, place_label):
     # fallback to geocode with Nominatim but constrained by 'name, city'
+    if not place_label:
+        return None, None
     try:
-        q = f"{name}, {polygon_gdf.iloc[0].display_name}"
-        loc = ox.geocoder.geocode(q)
+        q = f"{name}, {place_label}"
+        if _NOMINATIM_LOCK is None:
+            loc = ox.geocoder.geocode(q)
+        else:
+            with _NOMINATIM_LOCK:
+                loc = ox.geocoder.geocode(q)
         if isinstance(loc, (list, tuple)) and len(loc) == 2:
             return float(loc[0]), float(loc[1])
     except Exception:
         pass
     return None, None
 
-def auto_pick_stops(polygon_gdf, n: int):
+def auto_pick_stops(polygon_geom, n: int, crs="EPSG:4326"):
     # Pull candidate stations and pick n closest to centroid (diverse)
     tags = {
         "railway": ["station", "halt", "tram_stop"],
         "public_transport": ["station", "stop_position"],
     }
-    geom = polygon_gdf.geometry.iloc[0]
-    gdf = ox.features.features_from_polygon(geom, tags)
-    if gdf is None or not len(gdf):
+    gdf = ox.features.features_from_polygon(polygon_geom, tags)
+    if gdf is None or not len(gdf) or "name" not in gdf:
         return []
-    # Keep rows with a name
-    gdf = gdf[~gdf.get("name").isna()].copy()
+    # Keep rows with a name, and only the columns we use
+    gdf = gdf[["name", "geometry"]].dropna(subset=["name"])
     if not len(gdf):
         return []
-    # Distance to centroid
-    centroid = geom.centroid
-    gdf["dist_c"] = gdf.geometry.centroid.distance(centroid)
-    gdf = gdf.sort_values("dist_c").drop_duplicates(subset=["name"]).head(int(n * 2))
-    # Build list
-    out = []
-    for _, r in gdf.iterrows():
-        pt = r.geometry.representative_point()
-        out.append({"name": str(r["name"]), "lat": float(pt.y), "lon": float(pt.x)})
-        if len(out) >= n:
-            break
-    return out
+    # Distance to centroid, in metres (project once, then one vectorised hypot)
+    gdf_m = ox.projection.project_gdf(gdf)
+    cents = gdf_m.geometry.centroid
+    poly_m, _ = ox.projection.project_geometry(polygon_geom, crs=crs, to_crs=gdf_m.crs)
+    cx, cy = poly_m.centroid.coords[0]
+    d = np.hypot(cents.x.to_numpy() - cx, cents.y.to_numpy() - cy)
+    n = int(n)
+    if n <= 0:
+        return []
+    names = gdf["name"].to_numpy()
+    geoms = gdf.geometry.to_numpy()
+    # Nearest ~4n candidates by partial selection, then walk them in distance order,
+    # keeping the first (closest) row per name. Widen only if duplicates eat the pool.
+    k = min(n * 4, len(d))
+    while True:
+        cand = np.argpartition(d, k - 1)[:k] if k < len(d) else np.arange(len(d))
+        cand = cand[np.argsort(d[cand], kind="stable")]
+        out, seen = [], set()
+        for i in cand:
+            nm = str(names[i])
+            if nm in seen:
+                continue
+            seen.add(nm)
+            pt = geoms[i].representative_point()
+            out.append({"name": nm, "lat": float(pt.y), "lon": float(pt.x)})
+            if len(out) >= n:
+                return out
+        if k >= len(d):
+            return out
+        k = min(k * 2, len(d))
 
 def clean_name(s: str) -> str:
     return " ".join(str(s).strip().split())
 
+def build_one(city, poly_gdf, args):
+    """
+    Build one seed city (graph, stops file) from its boundary (polygon_from_seed)
+    and return its cities.json entry. Runs in a worker process when --workers > 1,
+    so it only writes its own outputs.
+    """
+    # Seed values
+    display_name = city.get("name")
+    place_name = city.get("place")
+    # Output name MUST be geocodable to a polygon for OSMnx runtime
+    name = place_name or display_name
+    slug = city["slug"]
+    enable = bool(city.get("enable", False))
+    print(f"\n=== {name} ({slug}) ===")
+
+    # Boundary & graph
+    poly_geom = poly_gdf.geometry.iloc[0]
+    place_label = poly_gdf.iloc[0].get("display_name")
+    G = graph_for_city(poly_geom, args.network)
+    graph_path = Path(args.out_graphs) / f"{slug}.graph"
+
+    write_graph_arrays(G, graph_path)
+    print(f"  • Graph saved: {graph_path} (nodes={len(G)}, edges={G.size() if hasattr(G,'size') else 'n/a'})")
+
+    # Facts
+    area_km2 = float(city.get("area_km2", 0) or 0)
+    if not area_km2:
+        # compute area from polygon
+        gdf_proj = ox.projection.project_gdf(poly_gdf)
+        area_km2 = float(gdf_proj.geometry.area.iloc[0] / 1_000_000.0)
+    population = city.get("population")
+    density_km2 = None
+    if population and area_km2:
+        try:
+            density_km2 = float(population) / float(area_km2)
+        except Exception:
+            density_km2 = None
+
+    # Stops
+    stops = []
+    preferred = city.get("stops", []) or []
+    if preferred:
+        names = [clean_name(raw) for raw in preferred]
+        found = match_stop_names(fetch_stop_pois(poly_geom), names)
+        for nm in names:
+            lat, lon = found.get(nm) or geocode_name_nominatim(nm, place_label)
+            if lat and lon:
+                stops.append({"name": nm, "lat": lat, "lon": lon})
+            else:
+                print(f"    ! WARN: could not geocode '{nm}' within polygon; skipping")
+    # auto-pick if not enough
+    if len(stops) < args.num_stops:
+        needed = args.num_stops - len(stops)
+        auto = auto_pick_stops(poly_geom, needed, crs=poly_gdf.crs)
+        # avoid dup names
+        have = {s["name"].lower() for s in stops}
+        for a in auto:
+            if a["name"].lower() not in have:
+                stops.append(a)
+                have.add(a["name"].lower())
+
+    # optional per-city stops json for simulator
+    if args.out_stops:
+        stops_path = Path(args.out_stops) / f"{slug}.json"
+        # Expected shapes by transport_sim.city_loader.get_tram_lookup_for_city:
+        #   either {"stops":[{"name","lat","lon"}, ...]} or a plain list of the same objects
+        stops_path.write_bytes(orjson.dumps({"stops": stops}, option=orjson.OPT_INDENT_2))
+        print(f"  • Stops saved: {stops_path} (n={len(stops)})")
+
+    # Aggregate for cities.json
+    city_out = {
+        "name": name,
+        "slug": slug,
+        "enabled": enable,
+        "facts": {
+            "population": population,
+            "area_km2": area_km2,
+            "density_km2": density_km2,
+            "source": "OSMnx geocoded (offline build)"
+        },
+        "stops": stops
+    }
+    # Preserve a friendly label if different from the geocodable name
+    if display_name and place_name and display_name != place_name:
+        city_out["display"] = display_name
+    # Optional hub passthrough from seed
+    if city.get("hub"):
+        city_out["hub"] = city["hub"]
+
+    return city_out
+
 def main():
     ap = argparse.ArgumentParser()
     ap.add_argument("--seed", required=True, help="Path to seed YAML/JSON")
@@ -198,6 +407,7 @@ def main():
     ap.add_argument("--out-stops", required=False, help="Dir for transport_sim/data/stops (optional)")
     ap.add_argument("--num-stops", type=int, default=12, help="Number of stops to auto-pick if not provided")
     ap.add_argument("--network", choices=["drive", "walk", "bike"], default="drive")
+    ap.add_argument("--workers", type=int, default=1, help="Cities to build in parallel (1 = serial, in-process)")
     args = ap.parse_args()
 
     seed_cities = load_seed(Path(args.seed))
@@ -212,96 +422,22 @@ def main():
     out_web = Path(args.out_web)
     ensure_dir(out_web.parent)
 
-    cities_out = []
-
-    for city in seed_cities:
-        # Seed values
-        display_name = city.get("name")
-        place_name = city.get("place")
-        # Output name MUST be geocodable to a polygon for OSMnx runtime
-        name = place_name or display_name
-        slug = city["slug"]
-        enable = bool(city.get("enable", False))
-        print(f"\n=== {name} ({slug}) ===")
-
-        # Boundary & graph
-        poly_gdf = polygon_from_seed(city)
-        G = graph_for_city(poly_gdf, args.network)
-        graph_path = out_graphs / f"{slug}.gpickle"
-
-        write_graph_pickle(G, graph_path)
-        print(f"  • Graph saved: {graph_path} (nodes={len(G)}, edges={G.size() if hasattr(G,'size') else 'n/a'})")
-
-        # Facts
-        area_km2 = float(city.get("area_km2", 0) or 0)
-        if not area_km2:
-            # compute area from polygon
-            gdf_proj = ox.projection.project_gdf(poly_gdf)
-            area_km2 = float(gdf_proj.geometry.area.iloc[0] / 1_000_000.0)
-        population = city.get("population")
-        density_km2 = None
-        if population and area_km2:
-            try:
-                density_km2 = float(population) / float(area_km2)
-            except Exception:
-                density_km2 = None
-
-        # Stops
-        stops = []
-        preferred = city.get("stops", []) or []
-        if preferred:
-            for raw in preferred:
-                nm = clean_name(raw)
-                lat, lon = geocode_name_in_poly(nm, poly_gdf)
-                if lat and lon:
-                    stops.append({"name": nm, "lat": lat, "lon": lon})
-                else:
-                    print(f"    ! WARN: could not geocode '{nm}' within polygon; skipping")
-        # auto-pick if not enough
-        if len(stops) < args.num_stops:
-            needed = args.num_stops - len(stops)
-            auto = auto_pick_stops(poly_gdf, needed)
-            # avoid dup names
-            have = {s["name"].lower() for s in stops}
-            for a in auto:
-                if a["name"].lower() not in have:
-                    stops.append(a)
-                    have.add(a["name"].lower())
-
-        # optional per-city stops json for simulator
-        if out_stops:
-            stops_path = out_stops / f"{slug}.json"
-            with open(stops_path, "w", encoding="utf-8") as f:
-                # Expected shapes by transport_sim.city_loader.get_tram_lookup_for_city:
-                #   either {"stops":[{"name","lat","lon"}, ...]} or a plain list of the same objects
-                json.dump({"stops": stops}, f, indent=2)
-            print(f"  • Stops saved: {stops_path} (n={len(stops)})")
-
-        # Aggregate for cities.json
-        city_out = {
-            "name": name,
-            "slug": slug,
-            "enabled": enable,
-            "facts": {
-                "population": population,
-                "area_km2": area_km2,
-                "density_km2": density_km2,
-                "source": "OSMnx geocoded (offline build)"
-            },
-            "stops": stops
-        }
-        # Preserve a friendly label if different from the geocodable name
-        if display_name and place_name and display_name != place_name:
-            city_out["display"] = display_name
-        # Optional hub passthrough from seed
-        if city.get("hub"):
-            city_out["hub"] = city["hub"]
-
-        cities_out.append(city_out)
+    # Boundaries first, one city at a time: place lookups hit Nominatim, which allows
+    # one request per second and is only throttled per process by OSMnx.
+    polys = [polygon_from_seed(city) for city in seed_cities]
+
+    workers = max(1, min(args.workers, len(seed_cities)))
+    if workers == 1:
+        cities_out = [build_one(city, poly, args) for city, poly in zip(seed_cities, polys)]
+    else:
+        # Cities share nothing else, so build them in parallel; map() keeps seed order
+        with ProcessPoolExecutor(
+            max_workers=workers, initializer=_init_worker, initargs=(multiprocessing.Lock(),)
+        ) as ex:
+            cities_out = list(ex.map(build_one, seed_cities, polys, [args] * len(seed_cities)))
 
     # Write cities.json
-    with open(out_web, "w", encoding="utf-8") as f:
-        json.dump(cities_out, f, indent=2)
+    Path(out_web).write_bytes(orjson.dumps(cities_out, option=orjson.OPT_INDENT_2))
     print(f"\n✅ Wrote {out_web} with {len(cities_out)} cities.")
 
 if __name__ == "__main__":
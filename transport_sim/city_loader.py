@@ -1,21 +1,57 @@
-import osmnx as ox
-import folium
-import numpy as np
+# osmnx / folium / numpy / scipy are imported inside the functions that need them:
+# stop lookups (get_tram_lookup_for_city) stay cheap to import and run.
 from pathlib import Path
-import json
+import orjson
 import re
-from folium.plugins import MarkerCluster
+from functools import lru_cache
 
 # Canonical cities.json for backend (API + sim share this)
 _CITIES_PATH = Path(__file__).resolve().parent / "data" / "cities.json"
 _STOPS_DIR   = Path(__file__).resolve().parent / "data" / "stops"
 
+# ASCII translate table: a-z0-9 kept, everything else -> "-"
+_SLUG_TBL = str.maketrans({
+    chr(i): (chr(i) if chr(i) in "abcdefghijklmnopqrstuvwxyz0123456789" else "-") for i in range(128)
+})
+_SLUG_RE = re.compile(r"[^a-z0-9]+")
+
 def _slugify(name: str) -> str:
-    return re.sub(r"[^a-z0-9]+", "-", name.lower()).strip("-")
+    s = name.lower()
+    if not s.isascii():
+        return _SLUG_RE.sub("-", s).strip("-")
+    s = s.translate(_SLUG_TBL)
+    while "--" in s:
+        s = s.replace("--", "-")
+    return s.strip("-")
 
 def _read_json(path: Path):
-    with open(path, "r", encoding="utf-8") as f:
-        return json.load(f)
+    return orjson.loads(path.read_bytes())
+
+def _mtime_ns(path: Path):
+    try:
+        return path.stat().st_mtime_ns
+    except OSError:
+        return None
+
+def _stops_to_lookup(stops) -> dict:
+    return { s["name"]: (float(s["lat"]), float(s["lon"])) for s in stops if "name" in s }
+
+@lru_cache(maxsize=64)
+def _override_lookup(path_str: str, mtime_ns: int) -> dict:
+    # mtime_ns is part of the cache key only: an edited file gets re-read
+    data = _read_json(Path(path_str))
+    stops = data["stops"] if isinstance(data, dict) and "stops" in data else data
+    return _stops_to_lookup(stops)
+
+@lru_cache(maxsize=1)
+def _cities_index(mtime_ns: int):
+    """({name: lookup}, {slug: lookup}) for cities.json at this mtime; first entry wins."""
+    by_name, by_slug = {}, {}
+    for c in _read_json(_CITIES_PATH):
+        lookup = _stops_to_lookup(c.get("stops", []))
+        by_name.setdefault(c.get("name"), lookup)
+        by_slug.setdefault(c.get("slug"), lookup)
+    return by_name, by_slug
 
 def get_tram_lookup_for_city(city_name: str) -> dict:
     """
@@ -25,118 +61,166 @@ def get_tram_lookup_for_city(city_name: str) -> dict:
       1) transport_sim/data/stops/<slug>.json  (optional per-city override)
       2) transport_sim/data/cities.json        (shared canonical list)
       3) {}                                    (fallback)
+
+    Parsed files are cached by mtime; the returned dict is shared, don't mutate it.
     """
+    slug = _slugify(city_name)
+
     # 1) Optional per-city override file
-    override = _STOPS_DIR / f"{_slugify(city_name)}.json"
-    if override.exists():
-        data = _read_json(override)
-        stops = data["stops"] if isinstance(data, dict) and "stops" in data else data
-        return { s["name"]: (float(s["lat"]), float(s["lon"])) for s in stops if "name" in s }
-
-    # 2) Shared cities.json
-    if _CITIES_PATH.exists():
-        cities = _read_json(_CITIES_PATH)
-        for c in cities:
-            if c.get("name") == city_name or c.get("slug") == _slugify(city_name):
-                stops = c.get("stops", [])
-                return { s["name"]: (float(s["lat"]), float(s["lon"])) for s in stops if "name" in s }
+    override = _STOPS_DIR / f"{slug}.json"
+    mtime = _mtime_ns(override)
+    if mtime is not None:
+        return _override_lookup(str(override), mtime)
+
+    # 2) Shared cities.json: exact name, else slug
+    mtime = _mtime_ns(_CITIES_PATH)
+    if mtime is not None:
+        by_name, by_slug = _cities_index(mtime)
+        lookup = by_name.get(city_name)
+        if lookup is None:
+            lookup = by_slug.get(slug)
+        if lookup is not None:
+            return lookup
 
     # 3) Nothing found
     return {}
 
-def load_city(city_name="Bournemouth, UK"):
+def load_city(city_name="Bournemouth, UK", *, with_directed=False):
+    """
+    Walk network for `city_name` as an undirected view over OSMnx's MultiDiGraph.
+    with_directed=True returns (directed graph, undirected view) instead; edits that
+    must reach both directions of a street (edge lengths, added edges) go to the first.
+    """
     # Step 1: Download and simplify graph
+    import osmnx as ox
     G = ox.graph_from_place(city_name, network_type="walk", simplify=True)
 
-    # Step 2: Project it to ensure lat/lon are assigned properly
-    G_proj = ox.project_graph(G, to_crs="EPSG:4326")
+    # graph_from_place already returns EPSG:4326 with lon/lat in x/y, so no projection step
 
-    # Step 3: Convert to undirected *after* projection
-    G_undirected = G_proj.to_undirected()
+    # Step 2: Undirected *view* (no copy; shares node/edge data with G)
+    G_undirected = G.to_undirected(as_view=True)
 
-    # Step 4: Ensure all nodes have x/y (some nodes get stripped during simplification)
-    for node, data in G_undirected.nodes(data=True):
+    # Step 3: Ensure all nodes have x/y (some nodes get stripped during simplification)
+    for node, data in G.nodes(data=True):
         if "x" not in data or "y" not in data:
             geom = data.get("geometry", None)
             if geom:
                 data["x"] = geom.x
                 data["y"] = geom.y
 
+    if with_directed:
+        return G, G_undirected
     return G_undirected
 
+def graph_to_csr(G, weight="length"):
+    """
+    CSR adjacency of G for scipy.sparse.csgraph. Parallel edges collapse to their
+    shortest; edges without `weight` count as 1 (as in NetworkX).
+    Returns (matrix, nodes, index): nodes[i] is the node on row i, index maps node -> row.
+    """
+    import numpy as np
+    from scipy.sparse import csr_matrix
+    nodes = list(G.nodes)
+    index = {n: i for i, n in enumerate(nodes)}
+    # one pass over the edges straight into a packed (u, v, w) record array
+    uvw = np.fromiter(
+        ((index[u], index[v], w) for u, v, w in G.edges(data=weight, default=1)),
+        dtype=[("u", np.int64), ("v", np.int64), ("w", np.float64)],
+    )
+    u, v, w = uvw["u"], uvw["v"], uvw["w"]
+    if G.is_multigraph():
+        # csr_matrix would *sum* parallel edges: sort by (u, v, w) and keep the
+        # first, i.e. lightest, edge per (u, v)
+        order = np.lexsort((w, v, u))
+        u, v, w = u[order], v[order], w[order]
+        first = np.ones(len(u), dtype=bool)
+        first[1:] = (u[1:] != u[:-1]) | (v[1:] != v[:-1])
+        u, v, w = u[first], v[first], w[first]
+    n = len(nodes)
+    matrix = csr_matrix((w, (u, v)), shape=(n, n))
+    return matrix, nodes, index
+
+def shortest_lengths_to(G, target, weight="length"):
+    """
+    {node: shortest-path length from node to `target`} for every node that can
+    reach it, via one Dijkstra over a CSR copy of G (undirected graphs: both ways).
+    """
+    import numpy as np
+    from scipy.sparse.csgraph import dijkstra
+    if target not in G:
+        return {}
+    matrix, nodes, index = graph_to_csr(G, weight)
+    directed = G.is_directed()
+    # distances *to* target on a directed graph = distances *from* it on the transpose
+    dist = dijkstra(matrix.T if directed else matrix, directed=directed, indices=index[target])
+    reach = np.flatnonzero(np.isfinite(dist))
+    return dict(zip([nodes[i] for i in reach], dist[reach].tolist()))
+
 def export_access_map(G, hub, distances, out_path, tramline_nodes=None, tramline_names=None):
     """
     Render an accessibility map centered on the hub and (optionally) a tramline polyline.
-    Draws markers for nodes in `distances` and auto-fits the map bounds to plotted points.
+    Draws a circle marker per node in `distances` (single GeoJson layer) and auto-fits the map bounds to plotted points.
     Note: prefers `tramline_nodes` (node IDs). Ignores `tramline_names` here.
     """
     import folium
-    from folium.plugins import MarkerCluster
+    import numpy as np
 
-    def node_latlon(n):
-        data = G.nodes.get(n)
-        if not data:
-            return None
-        y = data.get("y")
-        x = data.get("x")
-        return (y, x) if (y is not None and x is not None) else None
+    # node -> (lat, lon), built once and shared by centering, markers, tramline and bounds
+    coords = {
+        n: (d["y"], d["x"])
+        for n, d in G.nodes(data=True)
+        if d.get("y") is not None and d.get("x") is not None
+    }
 
     # Center map on hub (fallback to any node from distances, then graph centroid, then London-ish)
-    center = node_latlon(hub)
+    center = coords.get(hub)
     if center is None:
-        for n in distances.keys():
-            ll = node_latlon(n)
-            if ll:
-                center = ll
-                break
+        center = next((coords[n] for n in distances if n in coords), None)
     if center is None:
-        ys = [d.get("y") for _, d in G.nodes(data=True) if "y" in d and "x" in d]
-        xs = [d.get("x") for _, d in G.nodes(data=True) if "y" in d and "x" in d]
-        center = ((sum(ys) / len(ys), sum(xs) / len(xs)) if ys and xs else (51.5, -0.12))
+        center = tuple(np.mean(list(coords.values()), axis=0)) if coords else (51.5, -0.12)
 
     m = folium.Map(location=[center[0], center[1]], zoom_start=13)
-    mc = MarkerCluster().add_to(m)
 
-    # Plot accessibility markers
+    # Plot accessibility markers: one GeoJson layer instead of a JS object per marker
+    plotted = []
+    features = []
     for node, dist in distances.items():
-        ll = node_latlon(node)
+        ll = coords.get(node)
         if not ll:
             continue
-        folium.CircleMarker(
-            location=[ll[0], ll[1]],
-            radius=4,
-            color="blue",
-            fill=True,
-            fill_opacity=0.6,
-            popup=f"Node {node}, Dist: {dist:.0f}m",
-        ).add_to(mc)
+        plotted.append(ll)
+        features.append({
+            "type": "Feature",
+            "geometry": {"type": "Point", "coordinates": [ll[1], ll[0]]},
+            "properties": {"node": node, "dist": round(float(dist))},
+        })
+    if features:
+        folium.GeoJson(
+            {"type": "FeatureCollection", "features": features},
+            name="Accessibility",
+            marker=folium.CircleMarker(radius=4, color="blue", fill=True, fill_opacity=0.6),
+            popup=folium.GeoJsonPopup(fields=["node", "dist"], aliases=["Node", "Dist (m)"]),
+        ).add_to(m)
 
     # Draw tramline from node IDs if provided
     if tramline_nodes:
-        coords = [node_latlon(n) for n in tramline_nodes]
-        coords = [(lat, lon) for lat, lon in coords if lat is not None and lon is not None]
-        if len(coords) >= 2:
-            folium.PolyLine(coords, color="red", weight=3, opacity=0.8).add_to(m)
+        tram_coords = [coords[n] for n in tramline_nodes if n in coords]
+        if len(tram_coords) >= 2:
+            folium.PolyLine(tram_coords, color="red", weight=3, opacity=0.8).add_to(m)
+        plotted.extend(tram_coords)
 
     # Fit bounds to all plotted points (markers + tramline)
-    bounds_pts = []
-    bounds_pts.extend([node_latlon(n) for n in distances.keys()])
-    if tramline_nodes:
-        bounds_pts.extend([node_latlon(n) for n in tramline_nodes])
-    bounds_pts = [(lat, lon) for lat, lon in bounds_pts if lat is not None and lon is not None]
-
-    if bounds_pts:
-        min_lat = min(p[0] for p in bounds_pts)
-        max_lat = max(p[0] for p in bounds_pts)
-        min_lon = min(p[1] for p in bounds_pts)
-        max_lon = max(p[1] for p in bounds_pts)
+    if plotted:
+        pts = np.asarray(plotted, dtype=np.float64)
+        (min_lat, min_lon), (max_lat, max_lon) = pts.min(axis=0), pts.max(axis=0)
         if (max_lat - min_lat) > 1e-6 or (max_lon - min_lon) > 1e-6:
-            m.fit_bounds([[min_lat, min_lon], [max_lat, max_lon]])
+            m.fit_bounds([[float(min_lat), float(min_lon)], [float(max_lat), float(max_lon)]])
 
     m.save(out_path)
 
 
 def get_hub_node(G, location_name="Bournemouth Station"):
+    import osmnx as ox
     coords = ox.geocoder.geocode(location_name)
     node = ox.distance.nearest_nodes(G, coords[1], coords[0])
     return node
@@ -2,8 +2,10 @@
 #!/usr/bin/env python3
 import sys
 import os
-import json
+import re
 import argparse
+import orjson
+from functools import lru_cache
 from pathlib import Path
 
 # Ensure transport_sim package imports work when called from elsewhere
@@ -14,11 +16,12 @@ if str(ROOT_DIR) not in sys.path:
     sys.path.append(str(ROOT_DIR))
 
 import networkx as nx
+import numpy as np
 
 # Import simulation + city helpers
 from city_loader import get_tram_lookup_for_city
 from transport_sim.city_loader import load_city, get_hub_node, export_access_map
-from transport_sim.simulation import load_config, apply_scenario, run_abm, adjust_for_traffic
+from transport_sim.simulation import load_config, apply_scenario, run_abm, adjust_for_traffic, nearest_node, forget_hub_distances, MODES
 
 # -----------------------
 # Utilities
@@ -31,17 +34,27 @@ def parse_args():
     p.add_argument("positional_config", nargs="?", help="Optional positional config path (back-compat)")
     return p.parse_args()
 
+CITIES_JSON = BASE_DIR / "data" / "cities.json"
+_SLUG_RE = re.compile(r"[^a-z0-9]+")
+
+@lru_cache(maxsize=1)
+def _read_cities_cached(mtime_ns: int) -> list:
+    # mtime_ns is part of the cache key only: an edited file gets re-parsed
+    return orjson.loads(CITIES_JSON.read_bytes())
+
 def read_cities_json():
-    path = BASE_DIR / "data" / "cities.json"
-    if path.exists():
-        with open(path, "r", encoding="utf-8") as f:
-            return json.load(f)
-    return []
+    """Parsed cities.json (cached per file mtime; shared, don't mutate), or [] if absent."""
+    try:
+        mtime_ns = CITIES_JSON.stat().st_mtime_ns
+    except OSError:
+        return []
+    return _read_cities_cached(mtime_ns)
 
 def tram_lookup_from_cities(city_name: str) -> dict:
     cities = read_cities_json()
+    slug = slugify(city_name)
     for c in cities:
-        if c.get("name") == city_name or c.get("slug") == slugify(city_name):
+        if c.get("name") == city_name or c.get("slug") == slug:
             stops = c.get("stops", [])
             try:
                 return { s["name"]: (float(s["lat"]), float(s["lon"])) for s in stops if "name" in s }
@@ -57,27 +70,50 @@ def tram_lookup_from_cities(city_name: str) -> dict:
     return {}
 
 def slugify(name: str) -> str:
-    import re
-    return re.sub(r"[^a-z0-9]+", "-", str(name).lower()).strip("-")
+    return _SLUG_RE.sub("-", str(name).lower()).strip("-")
 
 def ensure_outdir(path: Path):
     path.mkdir(parents=True, exist_ok=True)
 
-def group_stats_by_mode(agents):
-    from collections import defaultdict
-    mode_stats = defaultdict(list)
-    for a in agents:
-        if getattr(a, "status", None) == "active":
-            mode_stats[a.mode].append(a.total_distance)
-    result = {}
-    for mode, dists in mode_stats.items():
-        if dists:
-            result[mode] = {
-                "avg": sum(dists) / len(dists),
-                "max": max(dists),
-                "count": len(dists),
-            }
-    return result
+def write_stats(stats: dict, path: Path, *aliases: Path):
+    """
+    Serialize once (orjson) to `path`, then hard-link each alias to it (copy of the
+    bytes where links aren't supported). Files are replaced, never rewritten in place,
+    so a link left by an earlier run in the same outdir is not clobbered.
+    """
+    payload = orjson.dumps(stats, option=orjson.OPT_SERIALIZE_NUMPY)
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_bytes(payload)
+    os.replace(tmp, path)
+    for alias in aliases:
+        try:
+            alias.unlink()
+        except FileNotFoundError:
+            pass
+        try:
+            os.link(path, alias)
+        except OSError:
+            alias.write_bytes(payload)
+
+def summarize(agents, dist_map):
+    """
+    (by_mode, distances) for an AgentArray in one pass over its active agents:
+    per-mode avg/max/count, and {home node: distance} for the access maps, read
+    from run_abm's hub distance map once per distinct home.
+    """
+    active = agents.active
+    dists = agents.distances[active]
+    mode_ids = agents.mode_ids[active]
+    count = np.bincount(mode_ids, minlength=len(MODES))
+    total = np.bincount(mode_ids, weights=dists, minlength=len(MODES))
+    mx = np.zeros(len(MODES))
+    np.maximum.at(mx, mode_ids, dists)
+    by_mode = {
+        mode: {"avg": float(total[m] / count[m]), "max": float(mx[m]), "count": int(count[m])}
+        for m, mode in enumerate(MODES) if count[m]
+    }
+    distances = {h: dist_map[h] for h in np.unique(agents.home_nodes[active]).tolist()}
+    return by_mode, distances
 
 # -----------------------
 # Main
@@ -136,15 +172,17 @@ def main():
         tram_coords_lookup = tram_lookup_from_cities(city_name)
 
     # Load graph and adjust for traffic
-    G_base = load_city(city_name)
-    G_base = adjust_for_traffic(G_base, traffic_level)
+    # G_dir is the directed graph under the undirected G_base view: edits go there
+    G_dir, G_base = load_city(city_name, with_directed=True)
+    adjust_for_traffic(G_dir, traffic_level)
 
     # Pick hub: prefer config, else cities.json's hub, else tram_start
     hub_name = config_raw.get("hub")
     if not hub_name:
         cities = read_cities_json()
+        slug = slugify(city_name)
         for c in cities:
-            if c.get("name") == city_name or c.get("slug") == slugify(city_name):
+            if c.get("name") == city_name or c.get("slug") == slug:
                 hub_name = c.get("hub") or hub_name
                 break
     if not hub_name:
@@ -155,21 +193,31 @@ def main():
         raise ValueError("Hub node not in undirected graph.")
 
     print("Running baseline…")
-    baseline_stats, baseline_agents = run_abm(
+    baseline_stats, baseline_agents, baseline_dist_map = run_abm(
         G_base, hub, num_agents, agent_distribution
     )
 
-    # Tramline scenario
-    G_scenario = G_base.copy()
+    # Tramline scenario: G_base plus a few tram edges. Instead of copying every node and
+    # edge dict, add them to G_dir (the graph under the G_base view) and take them out
+    # again once the maps are written. G_scenario is a separate read-only view, so it
+    # caches its own hub distances; G_base's cached ones would be wrong while the tram
+    # edges are in, so drop them (baseline_dist_map keeps this run's copy).
+    if G_dir.is_multigraph():
+        G_edit = G_dir
+        G_scenario = nx.graphviews.generic_graph_view(G_base)
+        forget_hub_distances(G_base)
+    else:
+        # add_edge would overwrite an existing road edge's data here: keep a private copy
+        G_edit = G_scenario = G_base.copy()
 
     # Try new-style apply_scenario(city-aware); fallback to legacy signature
     tram_nodes = None
     try:
-        tram_nodes = apply_scenario(G_scenario, scenario, city_name=city_name)
+        tram_nodes = apply_scenario(G_edit, scenario, city_name=city_name)
     except TypeError:
         # Legacy: relies on a global lookup in module; call once
         try:
-            tram_nodes = apply_scenario(G_scenario, scenario)
+            tram_nodes = apply_scenario(G_edit, scenario)
         except Exception:
             tram_nodes = None
 
@@ -179,12 +227,11 @@ def main():
         coords = [tram_coords_lookup.get(n) for n in names]
         if all(coords):
             try:
-                import osmnx as ox
-                n1 = ox.distance.nearest_nodes(G_scenario, coords[0][1], coords[0][0])
-                n2 = ox.distance.nearest_nodes(G_scenario, coords[1][1], coords[1][0])
+                n1 = nearest_node(G_edit, coords[0][1], coords[0][0])
+                n2 = nearest_node(G_edit, coords[1][1], coords[1][0])
                 # also add the edge in case apply_scenario didn't
-                G_scenario.add_edge(n1, n2, length=length, tram=True)
-                G_scenario.add_edge(n2, n1, length=length, tram=True)
+                G_edit.add_edge(n1, n2, length=length, tram=True)
+                G_edit.add_edge(n2, n1, length=length, tram=True)
                 tram_nodes = [n1, n2]
             except Exception:
                 tram_nodes = None
@@ -199,21 +246,15 @@ def main():
             pass
 
     print("Running tramline extension…")
-    tramline_stats, tramline_agents = run_abm(
-        G_scenario, hub, num_agents, agent_distribution, tram_nodes=tram_nodes
+    # G_scenario is G_base plus tram edges at tram_nodes: reuse the baseline distances
+    tramline_stats, tramline_agents, tramline_dist_map = run_abm(
+        G_scenario, hub, num_agents, agent_distribution, tram_nodes=tram_nodes,
+        baseline_dists=baseline_dist_map,
     )
 
-    # Per-mode summaries
-    baseline_stats["by_mode"] = group_stats_by_mode(baseline_agents)
-    tramline_stats["by_mode"] = group_stats_by_mode(tramline_agents)
-
-    # Distances for maps
-    baseline_distances = {
-        a.home_node: a.total_distance for a in baseline_agents if getattr(a, "status", None) == "active"
-    }
-    tramline_distances = {
-        a.home_node: a.total_distance for a in tramline_agents if getattr(a, "status", None) == "active"
-    }
+    # Per-mode summaries + distances for maps
+    baseline_stats["by_mode"], baseline_distances = summarize(baseline_agents, baseline_dist_map)
+    tramline_stats["by_mode"], tramline_distances = summarize(tramline_agents, tramline_dist_map)
 
     # Compute tramline nodes for colored map if names provided
     tramline_nodes = None
@@ -222,9 +263,9 @@ def main():
         latlon2 = tram_coords_lookup.get(tram_stops[1])
         if latlon1 and latlon2:
             try:
-                import osmnx as ox
-                n1 = ox.distance.nearest_nodes(G_scenario, latlon1[1], latlon1[0])
-                n2 = ox.distance.nearest_nodes(G_scenario, latlon2[1], latlon2[0])
+                # usually cache hits: apply_scenario already snapped these stops
+                n1 = nearest_node(G_edit, latlon1[1], latlon1[0])
+                n2 = nearest_node(G_edit, latlon2[1], latlon2[0])
                 tramline_nodes = [n1, n2]
             except Exception:
                 tramline_nodes = None
@@ -245,6 +286,13 @@ def main():
     )
     print(f"✅ Saved tramline map to {tramline_map}")
 
+    # Take the tram edges back out of the base graph (they all start at a tram node)
+    if G_edit is not G_scenario and tram_nodes:
+        forget_hub_distances(G_scenario)
+        G_edit.remove_edges_from([
+            (u, v, k) for u, v, k, tram in G_edit.edges(tram_nodes, keys=True, data="tram") if tram
+        ])
+
     # Write stats (unsuffixed + suffixed for compatibility)
     suffix = str(traffic_level).replace("-", "").lower()  # "offpeak" or "peak"
     baseline_unsuff = outdir / "baseline_stats.json"
@@ -252,14 +300,8 @@ def main():
     baseline_suff = outdir / f"baseline_stats_{suffix}.json"
     tramline_suff = outdir / f"tramline_stats_{suffix}.json"
 
-    with open(baseline_unsuff, "w") as f:
-        json.dump(baseline_stats, f)
-    with open(tramline_unsuff, "w") as f:
-        json.dump(tramline_stats, f)
-    with open(baseline_suff, "w") as f:
-        json.dump(baseline_stats, f)
-    with open(tramline_suff, "w") as f:
-        json.dump(tramline_stats, f)
+    write_stats(baseline_stats, baseline_unsuff, baseline_suff)
+    write_stats(tramline_stats, tramline_unsuff, tramline_suff)
 
     print("✅ Wrote stats:")
     print(f"   - {baseline_unsuff.name}, {tramline_unsuff.name}")
@@ -1,72 +1,87 @@
+import heapq
 import json
-import random
-import networkx as nx
-import osmnx as ox
-from dataclasses import dataclass
-from transport_sim.agent import Agent
-from transport_sim.city_loader import get_tram_lookup_for_city
-from collections import defaultdict
+import weakref
+import numpy as np
+from transport_sim.city_loader import get_tram_lookup_for_city, shortest_lengths_to
 
 
 
-def compute_stats(agents):
-    stats = {
-        "total_agents": len(agents),
-        "unreachable": 0,
-        "avg_distance": 0,
-        "min_distance": float("inf"),
-        "max_distance": 0,
-        "modes": defaultdict(lambda: {
-            "count": 0,
-            "reachable_count": 0,
-            "unreachable": 0,
-            "total_distance": 0,
-            "min_distance": float("inf"),
-            "max_distance": 0,
-            "avg_distance": None
-        })
-    }
+MODES = ("drive", "cycle", "tram")
 
-    total_reachable = 0
+class AgentArray:
+    """
+    Agents as parallel arrays (struct-of-arrays) instead of one object each:
+    home_nodes (OSM node ids), mode_ids (index into MODES), distances (0.0 where
+    unreachable) and the active mask (path to the hub found).
+    """
+    __slots__ = ("home_nodes", "mode_ids", "distances", "active")
 
-    for agent in agents:
-        mode = agent.mode
-        mode_stats = stats["modes"][mode]
-        mode_stats["count"] += 1
+    def __init__(self, n):
+        self.home_nodes = np.empty(n, dtype=np.int64)
+        self.mode_ids = np.empty(n, dtype=np.int8)
+        self.distances = np.zeros(n, dtype=np.float64)
+        self.active = np.zeros(n, dtype=bool)
 
-        if agent.status == 'unreachable':
-            stats["unreachable"] += 1
-            mode_stats["unreachable"] += 1
-            continue
+    def __len__(self):
+        return len(self.home_nodes)
 
-        # Reachable agent
-        dist = agent.total_distance
-        stats["avg_distance"] += dist
-        stats["min_distance"] = min(stats["min_distance"], dist)
-        stats["max_distance"] = max(stats["max_distance"], dist)
-        total_reachable += 1
-
-        mode_stats["reachable_count"] += 1
-        mode_stats["total_distance"] += dist
-        mode_stats["min_distance"] = min(mode_stats["min_distance"], dist)
-        mode_stats["max_distance"] = max(mode_stats["max_distance"], dist)
-
-    # Final averages
-    if total_reachable > 0:
-        stats["avg_distance"] /= total_reachable
-    else:
-        stats["avg_distance"] = None
-        stats["min_distance"] = None
-        stats["max_distance"] = None
 
-    for mode, m in stats["modes"].items():
-        if m["reachable_count"] > 0:
-            m["avg_distance"] = m["total_distance"] / m["reachable_count"]
-        else:
-            m["avg_distance"] = None
-            m["min_distance"] = None
-            m["max_distance"] = None
+_MODE_CODES = {m: i for i, m in enumerate(MODES)}
 
+def compute_stats(agents):
+    """
+    Overall and per-mode distance stats. Takes an AgentArray or a list of agent
+    objects (.mode, .status, .total_distance); the latter are encoded into arrays
+    in one Python pass. The sums / mins / maxes are then NumPy reductions per mode
+    code. "modes" always has one entry per MODES name, in that order; agents with
+    any other mode count towards the totals only.
+    """
+    k = len(MODES)
+    if isinstance(agents, AgentArray):
+        n = len(agents)
+        mode_ids, reachable, dists = agents.mode_ids, agents.active, agents.distances
+    else:
+        n = len(agents)
+        mode_ids = np.empty(n, dtype=np.intp)
+        reachable = np.empty(n, dtype=bool)
+        dists = np.zeros(n, dtype=np.float64)
+        for i, agent in enumerate(agents):
+            # unknown modes land in the spare bucket k, which is never reported
+            mode_ids[i] = _MODE_CODES.get(agent.mode, k)
+            reachable[i] = agent.status != 'unreachable'
+            if reachable[i]:
+                dists[i] = agent.total_distance
+
+    ids_r, d_r = mode_ids[reachable], dists[reachable]
+    count = np.bincount(mode_ids, minlength=k + 1)
+    reach_count = np.bincount(ids_r, minlength=k + 1)
+    total = np.bincount(ids_r, weights=d_r, minlength=k + 1)
+    mn = np.full(k + 1, np.inf)
+    mx = np.zeros(k + 1)
+    np.minimum.at(mn, ids_r, d_r)
+    np.maximum.at(mx, ids_r, d_r)
+
+    total_reachable = len(d_r)
+    stats = {
+        "total_agents": n,
+        "unreachable": n - total_reachable,
+        # Final averages
+        "avg_distance": float(d_r.sum() / total_reachable) if total_reachable else None,
+        "min_distance": float(d_r.min()) if total_reachable else None,
+        "max_distance": max(0.0, float(d_r.max())) if total_reachable else None,
+        "modes": {},
+    }
+    for c, mode in enumerate(MODES):
+        r = int(reach_count[c])
+        stats["modes"][mode] = {
+            "count": int(count[c]),
+            "reachable_count": r,
+            "unreachable": int(count[c]) - r,
+            "total_distance": float(total[c]) if r else 0,
+            "min_distance": float(mn[c]) if r else None,
+            "max_distance": float(mx[c]) if r else None,
+            "avg_distance": float(total[c] / r) if r else None,
+        }
     return stats
 
 def load_config(path="transport_sim/config.json"):
@@ -74,6 +89,45 @@ def load_config(path="transport_sim/config.json"):
     with open(path) as f:
         return json.load(f)
 
+# graph -> {(lat, lon) rounded to 1e-6 deg: nearest node} and graph -> (BallTree, node
+# ids by row). Node sets don't change once loaded (scenarios only add edges), so both
+# stay valid for the graph's life.
+_NEAREST_CACHE = weakref.WeakKeyDictionary()
+_BALLTREES = weakref.WeakKeyDictionary()
+
+def _node_balltree(graph):
+    """Haversine BallTree over the nodes' (lat, lon), built once per graph."""
+    entry = _BALLTREES.get(graph)
+    if entry is None:
+        from sklearn.neighbors import BallTree
+        nodes, yx = [], []
+        for n, d in graph.nodes(data=True):
+            if d.get("y") is not None and d.get("x") is not None:
+                nodes.append(n)
+                yx.append((d["y"], d["x"]))
+        tree = BallTree(np.radians(np.asarray(yx, dtype=np.float64)), metric="haversine")
+        entry = _BALLTREES[graph] = (tree, nodes)
+    return entry
+
+def nearest_node(graph, lon, lat):
+    """Nearest graph node to one (lon, lat) point; see nearest_nodes."""
+    return nearest_nodes(graph, [lon], [lat])[0]
+
+def nearest_nodes(graph, lons, lats):
+    """
+    Nearest graph node (great-circle) for each point. Results are cached per graph,
+    and misses are one query against the graph's BallTree (what ox.distance.nearest_nodes
+    does for unprojected graphs, minus rebuilding the tree on every call).
+    """
+    per_graph = _NEAREST_CACHE.setdefault(graph, {})
+    keys = [(round(float(lat), 6), round(float(lon), 6)) for lon, lat in zip(lons, lats)]
+    missing = list(dict.fromkeys(k for k in keys if k not in per_graph))
+    if missing:
+        tree, nodes = _node_balltree(graph)
+        idx = tree.query(np.radians(np.asarray(missing, dtype=np.float64)), k=1, return_distance=False)
+        per_graph.update(zip(missing, (nodes[i] for i in idx[:, 0].tolist())))
+    return [per_graph[k] for k in keys]
+
 def apply_scenario(graph, scenario, *, city_name=None, tram_lookup=None):
     # derive lookup
     lookup = tram_lookup or (get_tram_lookup_for_city(city_name) if city_name else {})
@@ -82,16 +136,18 @@ def apply_scenario(graph, scenario, *, city_name=None, tram_lookup=None):
     if len(stops) < 2:
         return []
 
+    # snap every known stop in one batch (one spatial index build, not two per segment)
+    known = [s for s in dict.fromkeys(stops) if lookup.get(s)]
+    snapped = dict(zip(known, nearest_nodes(
+        graph, [lookup[s][1] for s in known], [lookup[s][0] for s in known]
+    ))) if known else {}
+
     added = []
     for i in range(len(stops) - 1):
         s1, s2 = stops[i], stops[i+1]
-        c1, c2 = lookup.get(s1), lookup.get(s2)
-        if not (c1 and c2):
+        if not (s1 in snapped and s2 in snapped):
             continue
-        lat1, lon1 = c1
-        lat2, lon2 = c2
-        n1 = ox.distance.nearest_nodes(graph, lon1, lat1)
-        n2 = ox.distance.nearest_nodes(graph, lon2, lat2)
+        n1, n2 = snapped[s1], snapped[s2]
         graph.add_edge(n1, n2, length=length, tram=True)
         graph.add_edge(n2, n1, length=length, tram=True)
         added.extend([n1, n2])
@@ -121,22 +177,83 @@ def apply_scenario(graph, scenario, *, city_name=None, tram_lookup=None):
 #     return None, None
 
 
-def run_abm(graph, hub, num_agents, agent_distribution, tram_nodes=None):
+# graph -> {hub: {node: distance to hub}}; weak keys so graphs are not kept alive.
+# Entries assume the graph is not edited after its first run_abm call; code that does
+# edit it (or the graph under a view of it) must call forget_hub_distances first.
+_DIST_CACHE = weakref.WeakKeyDictionary()
+
+def forget_hub_distances(graph):
+    """Drop `graph`'s cached hub distances (call before editing its edges)."""
+    _DIST_CACHE.pop(graph, None)
+
+def _edge_weight(graph, u, v):
+    # lightest parallel edge, NetworkX's default of 1 when 'length' is missing
+    data = graph[u][v]
+    if graph.is_multigraph():
+        return min(d.get("length", 1) for d in data.values())
+    return data.get("length", 1)
+
+def _repair_distances(graph, hub, base, changed):
+    """
+    Distances to `hub` after edges touching `changed` were added to a graph whose
+    distances were `base`. Adding edges can only shorten paths, so start from
+    `base`, re-evaluate the changed nodes, and push improvements back through
+    their predecessors (Dijkstra order) - the rest of the map is reused as-is.
+    """
+    dist = dict(base)
+    dist.setdefault(hub, 0.0)
+    succ = graph.succ if graph.is_directed() else graph.adj
+    pred = graph.pred if graph.is_directed() else graph.adj
+    heap = []
+    for u in changed:
+        if u not in graph:
+            continue
+        best = dist.get(u, float("inf"))
+        for v in succ[u]:
+            dv = dist.get(v)
+            if dv is not None:
+                best = min(best, _edge_weight(graph, u, v) + dv)
+        if best < dist.get(u, float("inf")):
+            dist[u] = best
+            heapq.heappush(heap, (best, u))
+    while heap:
+        dx, x = heapq.heappop(heap)
+        if dx > dist[x]:
+            continue
+        for y in pred[x]:
+            dy = _edge_weight(graph, y, x) + dx
+            if dy < dist.get(y, float("inf")):
+                dist[y] = dy
+                heapq.heappush(heap, (dy, y))
+    return dist
+
+def hub_distances(graph, hub, *, base=None, changed=None):
+    """
+    Cached {node: shortest-path length to hub}. With `base` (distances on the same
+    graph before edges touching `changed` were added) the map is repaired
+    incrementally instead of recomputed; otherwise one full CSR Dijkstra runs.
+    """
+    per_graph = _DIST_CACHE.setdefault(graph, {})
+    if hub not in per_graph:
+        if base is not None and changed and graph.is_multigraph() and hub in graph:
+            # multigraph: add_edge only adds parallel edges, so nothing got longer
+            per_graph[hub] = _repair_distances(graph, hub, base, changed)
+        else:
+            per_graph[hub] = shortest_lengths_to(graph, hub)
+    return per_graph[hub]
+
+def run_abm(graph, hub, num_agents, agent_distribution, tram_nodes=None, baseline_dists=None):
     """
     Very lightweight ABM:
       - Samples an agent 'mode' using the provided percentage distribution.
       - Home node is random; if mode=='tram' and tram_nodes provided, choose from those.
       - Distance is the shortest-path length (by 'length') from home -> hub.
-      - Returns (stats_dict, agents_list), where each agent has attributes:
-          .home_node, .mode, .total_distance, .status
+      - Returns (stats_dict, agents, dist_to_hub) where agents is an AgentArray
+        (parallel home_nodes / mode_ids / distances / active arrays) and dist_to_hub
+        is the {node: distance} map the agents were looked up in (shared, read-only).
+      - baseline_dists: hub distances on the graph this one was copied from before
+        the tram edges (incident to tram_nodes) were added; enables an incremental update.
     """
-    @dataclass
-    class ABMAgent:
-        home_node: int
-        mode: str
-        total_distance: float
-        status: str  # 'active' if path found, otherwise 'inactive'
-
     # normalize distribution and build sampling weights
     dist = agent_distribution or {}
     drive_p = float(dist.get("drive", 0))
@@ -148,17 +265,13 @@ def run_abm(graph, hub, num_agents, agent_distribution, tram_nodes=None):
         drive_p = cycle_p = tram_p = 1.0
         total_p = 3.0
     weights = [drive_p / total_p, cycle_p / total_p, tram_p / total_p]
-    modes = ["drive", "cycle", "tram"]
 
     # ensure we have a list of candidates for tram homes if provided
     tram_nodes = list(tram_nodes) if tram_nodes else None
 
-    agents = []
-    dists = []
-    by_mode_count = {"drive": 0, "cycle": 0, "tram": 0}
-    active_count = 0
-
     nodes_list = list(graph.nodes)
+    n = int(num_agents or 0) if nodes_list else 0
+    agents = AgentArray(n)
     if not nodes_list:
         return (
             {
@@ -167,47 +280,49 @@ def run_abm(graph, hub, num_agents, agent_distribution, tram_nodes=None):
                 "avg_distance": 0.0,
                 "max_distance": 0.0,
                 "min_distance": 0.0,
-                "modes": by_mode_count,
+                "modes": dict.fromkeys(MODES, 0),
             },
             agents,
+            {},
         )
 
-    for _ in range(int(num_agents or 0)):
-        mode = random.choices(modes, weights=weights, k=1)[0]
-        # choose a home node
-        if mode == "tram" and tram_nodes:
-            home = random.choice(tram_nodes)
-        else:
-            home = random.choice(nodes_list)
-
-        # compute shortest-path distance (meters if OSMnx 'length' present)
-        try:
-            dist = nx.shortest_path_length(graph, source=home, target=hub, weight="length")
-            agents.append(ABMAgent(home_node=home, mode=mode, total_distance=float(dist), status="active"))
-            dists.append(float(dist))
-            by_mode_count[mode] += 1
-            active_count += 1
-        except (nx.NetworkXNoPath, nx.NodeNotFound, KeyError, ValueError):
-            agents.append(ABMAgent(home_node=home, mode=mode, total_distance=0.0, status="inactive"))
-
-    if dists:
-        avg_d = sum(dists) / len(dists)
-        max_d = max(dists)
-        min_d = min(dists)
-    else:
-        avg_d = max_d = min_d = 0.0
-
+    # One Dijkstra from the hub (CSR/scipy) instead of a NetworkX search per agent;
+    # a scenario run repairs the baseline map around the tram nodes instead
+    dist_to_hub = hub_distances(graph, hub, base=baseline_dists, changed=tram_nodes)
+
+    # Sample every agent's mode and home up front (one RNG call each, not 2 per agent);
+    # tram agents live at a tram node when those are given
+    rng = np.random.default_rng()
+    agents.mode_ids[:] = rng.choice(len(MODES), size=n, p=weights)
+    agents.home_nodes[:] = np.asarray(nodes_list, dtype=np.int64)[rng.integers(len(nodes_list), size=n)]
+    if tram_nodes:
+        is_tram = agents.mode_ids == MODES.index("tram")
+        tram_arr = np.asarray(tram_nodes, dtype=np.int64)
+        agents.home_nodes[is_tram] = tram_arr[rng.integers(len(tram_arr), size=int(is_tram.sum()))]
+
+    # shortest-path distance (meters if OSMnx 'length' present); missing = no path
+    dists = np.fromiter(
+        (dist_to_hub.get(h, np.nan) for h in agents.home_nodes.tolist()), dtype=np.float64, count=n
+    )
+    agents.active[:] = ~np.isnan(dists)
+    agents.distances[agents.active] = dists[agents.active]
+
+    d = agents.distances[agents.active]
+    by_mode = np.bincount(agents.mode_ids[agents.active], minlength=len(MODES))
     stats = {
         "count": int(num_agents or 0),
-        "active": active_count,
-        "avg_distance": avg_d,
-        "max_distance": max_d,
-        "min_distance": min_d,
-        "modes": by_mode_count,
+        "active": int(d.size),
+        "avg_distance": float(d.mean()) if d.size else 0.0,
+        "max_distance": float(d.max()) if d.size else 0.0,
+        "min_distance": float(d.min()) if d.size else 0.0,
+        "modes": dict(zip(MODES, by_mode.tolist())),
     }
-    return stats, agents
+    return stats, agents, dist_to_hub
 
 
+# graph -> (edge count, [edge data dicts with a length], base lengths array). Kept
+# outside G.graph so copies of a graph never share (and rescale) its data dicts.
+_TRAFFIC_BASE = weakref.WeakKeyDictionary()
 
 def adjust_for_traffic(G, traffic_level):
     """
@@ -216,22 +331,32 @@ def adjust_for_traffic(G, traffic_level):
 
     - Stores original length once in 'base_length' to avoid compounding.
     - Returns the same graph (mutated in-place) for convenience.
+    - For load_city's undirected view pass the directed graph underneath it
+      (load_city(..., with_directed=True)): the view lists a two-way street once,
+      but each direction keeps its own data dict, and the view reads those directly.
     """
     level = (traffic_level or "").strip().lower()
     is_peak = level in ("peak", "rush hour", "rush-hour", "rushhour")
 
-    for u, v, data in G.edges(data=True):
-        # remember the baseline once
-        base_len = data.get("base_length", data.get("length", None))
-        if base_len is None:
-            # if no length present, skip gracefully
-            continue
-        data["base_length"] = base_len
-
-        # apply/reset congestion factor
-        if is_peak:
-            data["length"] = float(base_len) * 1.5
-        else:
-            data["length"] = float(base_len)
+    # First call (or edges added since): remember each edge's data dict and its
+    # baseline length once; later calls are one array multiply plus the write-back.
+    cache = _TRAFFIC_BASE.get(G)
+    if cache is None or cache[0] != G.number_of_edges():
+        edge_data, base = [], []
+        for _, _, data in G.edges(data=True):
+            base_len = data.get("base_length", data.get("length", None))
+            if base_len is None:
+                # if no length present, skip gracefully
+                continue
+            data["base_length"] = base_len
+            edge_data.append(data)
+            base.append(float(base_len))
+        cache = _TRAFFIC_BASE[G] = (G.number_of_edges(), edge_data, np.array(base, dtype=np.float64))
+    _, edge_data, base = cache
+
+    # apply/reset congestion factor
+    scaled = base * 1.5 if is_peak else base
+    for data, length in zip(edge_data, scaled.tolist()):
+        data["length"] = length
 
     return G